@@ -0,0 +1,10 @@
+from .invalidation import (
+    listen_for_invalidations,
+    publish_invalidation,
+    register_invalidation_handler,
+)
+from .hot import FrequencySketch, HotCodes, hot_codes
+from .principal import Principal, PrincipalCache, principal_cache
+from .redirect import CachedRedirect, RedirectCache, redirect_cache
+from .shared import NOT_FOUND, SharedRedirect, SharedRedirectCache, shared_redirect_cache
+from .versions import UserVersions, profile_versions, user_versions
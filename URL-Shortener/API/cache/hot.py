@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Tuple
+
+from API.config import settings
+from API.db import redis_client
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Halves every 8-bit counter in one C-level pass.
+_HALVE = bytes(count >> 1 for count in range(256))
+
+
+class FrequencySketch:
+    """Count-Min Sketch of how often each short code was redirected recently.
+
+    Four rows of saturating 8-bit counters; the estimate is the smallest of a
+    key's four counters, which can only overestimate. Every ``sample_size``
+    additions all counters are halved (TinyLFU's reset), so the sketch
+    follows popularity as it shifts instead of remembering it forever.
+    """
+
+    def __init__(self, width: int, sample_size: int) -> None:
+        self.width = 1 << max(4, (width - 1).bit_length())
+        self._mask = self.width - 1
+        self.sample_size = sample_size
+        self._rows = [bytearray(self.width) for _ in range(4)]
+        self._additions = 0
+        self.resets = 0
+
+    def _slots(self, key: str):
+        # Double hashing; hash() is per process, which is all a local sketch
+        # needs. Unrolled: this runs on every redirect.
+        h = hash(key)
+        step = (h >> 32) | 1
+        mask = self._mask
+        r0, r1, r2, r3 = self._rows
+        return (
+            (r0, h & mask),
+            (r1, (h + step) & mask),
+            (r2, (h + 2 * step) & mask),
+            (r3, (h + 3 * step) & mask),
+        )
+
+    def add(self, key: str) -> int:
+        """Count one occurrence of ``key`` and return its new estimate."""
+        estimate = 255
+        for row, index in self._slots(key):
+            count = row[index]
+            if count < 255:
+                count += 1
+                row[index] = count
+            if count < estimate:
+                estimate = count
+        self._additions += 1
+        if self._additions >= self.sample_size:
+            self.reset()
+        return estimate
+
+    def seed(self, key: str, count: int) -> None:
+        """Raise ``key``'s estimate to at least ``count``."""
+        count = min(count, 255)
+        for row, index in self._slots(key):
+            if row[index] < count:
+                row[index] = count
+
+    def estimate(self, key: str) -> int:
+        return min(row[index] for row, index in self._slots(key))
+
+    def reset(self) -> None:
+        self._rows = [row.translate(_HALVE) for row in self._rows]
+        self._additions //= 2
+        self.resets += 1
+
+
+class HotCodes:
+    """Heavy-hitter tracking of short codes, merged across replicas in Dragonfly.
+
+    Every redirect is counted in a :class:`FrequencySketch`. The ``tracked``
+    codes with the highest estimates have their redirects counted exactly;
+    a code replaces the least popular tracked one once its estimate is
+    higher. :meth:`run` adds those counts to a sorted set per minute that all
+    replicas share, trimmed to ``window_members`` codes, so the top codes of
+    any recent window are a ZUNION away.
+    """
+
+    prefix = "hot:"
+
+    def __init__(
+        self,
+        tracked: int,
+        sketch_width: int,
+        sample_size: int,
+        flush_interval: float,
+        retention_minutes: int,
+        window_members: int,
+        enabled: bool = True,
+    ) -> None:
+        self.capacity = tracked
+        self.sketch = FrequencySketch(sketch_width, sample_size)
+        self.flush_interval = flush_interval
+        self.retention_minutes = retention_minutes
+        self.window_members = window_members
+        self.enabled = enabled
+        self.tracked: Dict[str, int] = {}
+        self._pending: Dict[str, int] = {}
+        self._floor = 0
+        self._resets = 0
+        self.flushes = 0
+        self.failures = 0
+
+    def record(self, code: str) -> None:
+        estimate = self.sketch.add(code)
+        if self.sketch.resets != self._resets:
+            self._age()
+        tracked = self.tracked
+        if code in tracked:
+            tracked[code] += 1
+        elif len(tracked) < self.capacity:
+            tracked[code] = estimate
+            if len(tracked) == self.capacity:
+                self._floor = min(tracked.values())
+        elif estimate > self._floor:
+            # The floor only lags behind the tracked counts, which only grow
+            # between resets; check the real minimum before evicting.
+            victim = min(tracked, key=tracked.__getitem__)
+            if estimate <= tracked[victim]:
+                self._floor = tracked[victim]
+                return
+            del tracked[victim]
+            tracked[code] = estimate
+            self._floor = min(tracked.values())
+        else:
+            return
+        self._pending[code] = self._pending.get(code, 0) + 1
+
+    def _age(self) -> None:
+        self._resets = self.sketch.resets
+        self.tracked = {code: count >> 1 for code, count in self.tracked.items()}
+        self._floor = min(self.tracked.values(), default=0)
+
+    def frequency(self, code: str) -> int:
+        return self.sketch.estimate(code)
+
+    def seed(self, code: str, count: int) -> None:
+        self.sketch.seed(code, count)
+
+    @staticmethod
+    def _minute(at: float) -> int:
+        return int(at // 60)
+
+    async def flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        if not pending or not self.enabled:
+            return
+        key = f"{self.prefix}{self._minute(time.time())}"
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for code, count in pending.items():
+                    pipe.zincrby(key, count, code)
+                pipe.zremrangebyrank(key, 0, -self.window_members - 1)
+                pipe.expire(key, self.retention_minutes * 60 + 60)
+                await pipe.execute()
+        except RedisError:
+            self.failures += 1
+            logger.warning("Could not publish %d hot code counts", len(pending))
+            return
+        self.flushes += 1
+
+    async def run(self) -> None:
+        """Publish the tracked counts every ``flush_interval`` seconds until cancelled."""
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            await self.flush()
+
+    async def top(self, minutes: int, limit: int) -> List[Tuple[str, int]]:
+        """Most redirected codes over the last ``minutes`` minutes, all replicas.
+
+        Counts are lower bounds: a replica only counts a code exactly while it
+        tracks it. Without the shared cache this replica's view is returned.
+        """
+        if not self.enabled:
+            ranked = sorted(self.tracked.items(), key=lambda item: -item[1])
+            return ranked[:limit]
+        now = self._minute(time.time())
+        keys = [
+            f"{self.prefix}{minute}"
+            for minute in range(now - min(minutes, self.retention_minutes) + 1, now + 1)
+        ]
+        try:
+            ranked = await redis_client.zunion(keys, withscores=True)
+        except RedisError:
+            logger.warning("Hot codes unavailable")
+            return []
+        return [(code, int(score)) for code, score in reversed(ranked[-limit:])]
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self.tracked),
+            "capacity": self.capacity,
+            "floor": self._floor,
+            "sketch_width": self.sketch.width,
+            "sketch_resets": self.sketch.resets,
+            "flushes": self.flushes,
+            "failures": self.failures,
+        }
+
+
+hot_codes = HotCodes(
+    tracked=settings.HOT_CODES_TRACKED,
+    # About ten counters per cached entry keeps collisions rare.
+    sketch_width=10 * max(settings.REDIRECT_CACHE_SIZE, settings.HOT_CODES_TRACKED),
+    sample_size=10 * max(settings.REDIRECT_CACHE_SIZE, settings.HOT_CODES_TRACKED),
+    flush_interval=settings.HOT_CODES_FLUSH_INTERVAL,
+    retention_minutes=settings.HOT_CODES_RETENTION_MINUTES,
+    window_members=settings.HOT_CODES_WINDOW_MEMBERS,
+    enabled=settings.SHARED_CACHE_ENABLED,
+)
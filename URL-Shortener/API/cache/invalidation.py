@@ -0,0 +1,61 @@
+import asyncio
+import json
+import logging
+from typing import Callable, Dict, Iterable
+
+from API.config import settings
+from API.db import redis_client
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+_handlers: Dict[str, Callable[[str], None]] = {}
+
+
+def register_invalidation_handler(kind: str, handler: Callable[[str], None]) -> None:
+    """Register the local handler called for every key of ``kind`` invalidated
+    by any replica (including this one)."""
+    _handlers[kind] = handler
+
+
+async def publish_invalidation(kind: str, keys: Iterable[str]) -> None:
+    keys = list(keys)
+    if not keys:
+        return
+    for key in keys:
+        _dispatch(kind, key)
+    if not settings.SHARED_CACHE_ENABLED:
+        return
+    try:
+        await redis_client.publish(
+            settings.CACHE_INVALIDATION_CHANNEL,
+            json.dumps({"kind": kind, "keys": keys}),
+        )
+    except RedisError:
+        logger.warning("Failed to publish %s invalidation for %d keys", kind, len(keys))
+
+
+def _dispatch(kind: str, key: str) -> None:
+    handler = _handlers.get(kind)
+    if handler is not None:
+        handler(key)
+
+
+async def listen_for_invalidations() -> None:
+    """Apply invalidations published by other replicas until cancelled."""
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                try:
+                    data = json.loads(message["data"])
+                    for key in data["keys"]:
+                        _dispatch(data["kind"], key)
+                except (KeyError, TypeError, ValueError):
+                    logger.warning("Ignoring malformed invalidation message")
+        except RedisError:
+            logger.warning("Invalidation subscription lost, reconnecting")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
@@ -0,0 +1,106 @@
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+
+from API.config import settings
+from API.schemas import TokenPayload
+
+from .invalidation import register_invalidation_handler
+
+
+class Principal(NamedTuple):
+    """Slim, immutable view of an authenticated user."""
+
+    id: uuid.UUID
+    username: str
+    email: str
+    is_active: bool
+    is_superuser: bool
+    created_at: datetime
+    updated_at: datetime
+
+
+class PrincipalCache:
+    """Caches decoded access tokens and the users they belong to.
+
+    Tokens are keyed by the SHA-256 digest of the raw token and kept until the
+    token's ``exp`` or ``ttl`` seconds, whichever comes first, so repeated
+    requests skip ``jwt.decode``. User records are keyed by user id so that a
+    profile change or deletion invalidates them with a single key.
+    """
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._tokens: OrderedDict[bytes, Tuple[TokenPayload, float]] = OrderedDict()
+        self._users: OrderedDict[str, Tuple[Principal, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    @staticmethod
+    def _get(entries: OrderedDict, key):
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        value, deadline = entry
+        if deadline <= time.time():
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return value
+
+    def _put(self, entries: OrderedDict, key, value, deadline: float) -> None:
+        if self.max_entries <= 0:
+            return
+        entries[key] = (value, deadline)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def get_token(self, digest: bytes) -> Optional[TokenPayload]:
+        payload = self._get(self._tokens, digest)
+        if payload is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return payload
+
+    def set_token(self, digest: bytes, payload: TokenPayload) -> None:
+        deadline = min(payload.exp.timestamp(), time.time() + self.ttl)
+        self._put(self._tokens, digest, payload, deadline)
+
+    def get_user(self, user_id: str) -> Optional[Principal]:
+        principal = self._get(self._users, user_id)
+        if principal is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return principal
+
+    def set_user(self, principal: Principal) -> None:
+        self._put(self._users, principal.id.hex, principal, time.time() + self.ttl)
+
+    def invalidate_user(self, user_id: str) -> None:
+        self._users.pop(uuid.UUID(user_id).hex, None)
+
+    def stats(self) -> dict:
+        return {
+            "tokens": len(self._tokens),
+            "users": len(self._users),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+principal_cache = PrincipalCache(
+    max_entries=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL
+)
+
+register_invalidation_handler("principal", principal_cache.invalidate_user)
@@ -0,0 +1,126 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, NamedTuple, Optional
+
+from API.config import settings
+
+from .hot import hot_codes
+
+
+class CachedRedirect(NamedTuple):
+    short_url_id: str
+    original_url: str
+    expires_at: Optional[datetime]
+    is_permanent: bool
+    analytics_enabled: bool
+    stale_at: float
+
+
+class RedirectCache:
+    """Bounded in-process LRU cache mapping short codes to redirect targets.
+
+    Entries are dropped after ``ttl`` seconds, which bounds how long a replica
+    that missed an invalidation can keep serving an outdated target. With a
+    ``frequency`` estimator a full cache only admits a new code that is more
+    popular than the least recently used entry (TinyLFU), so a burst of
+    one-off codes cannot flush out the hot ones.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        frequency: Optional[Callable[[str], int]] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.frequency = frequency
+        self._entries: OrderedDict[str, CachedRedirect] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.rejections = 0
+
+    def get(self, code: str) -> Optional[CachedRedirect]:
+        entry = self._entries.get(code)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.stale_at <= time.monotonic():
+            del self._entries[code]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(code)
+        self.hits += 1
+        return entry
+
+    def set(
+        self,
+        code: str,
+        short_url_id: str,
+        original_url: str,
+        expires_at: Optional[datetime],
+        is_permanent: bool = False,
+        analytics_enabled: bool = True,
+    ) -> CachedRedirect:
+        entry = CachedRedirect(
+            short_url_id=short_url_id,
+            original_url=original_url,
+            expires_at=expires_at,
+            is_permanent=is_permanent,
+            analytics_enabled=analytics_enabled,
+            stale_at=time.monotonic() + self.ttl,
+        )
+        if self.max_entries <= 0:
+            return entry
+        if (
+            self.frequency is not None
+            and len(self._entries) >= self.max_entries
+            and code not in self._entries
+        ):
+            victim = next(iter(self._entries))
+            if self.frequency(code) <= self.frequency(victim):
+                self.rejections += 1
+                return entry
+        self._entries[code] = entry
+        self._entries.move_to_end(code)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def invalidate(self, code: str) -> None:
+        if self._entries.pop(code, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "rejections": self.rejections,
+        }
+
+
+redirect_cache = RedirectCache(
+    max_entries=settings.REDIRECT_CACHE_SIZE,
+    ttl=settings.REDIRECT_CACHE_TTL,
+    frequency=hot_codes.frequency if settings.REDIRECT_CACHE_ADMISSION else None,
+)
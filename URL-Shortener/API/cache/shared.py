@@ -0,0 +1,149 @@
+import json
+import logging
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+
+from API.config import settings
+from API.db import redis_client
+from redis.exceptions import RedisError
+
+from .invalidation import publish_invalidation, register_invalidation_handler
+from .redirect import redirect_cache
+
+logger = logging.getLogger(__name__)
+
+
+class SharedRedirect(NamedTuple):
+    short_url_id: str
+    original_url: str
+    expires_at: Optional[datetime]
+    is_permanent: bool = False
+    analytics_enabled: bool = True
+
+
+# Marker returned for codes recently confirmed not to exist.
+NOT_FOUND = SharedRedirect("", "", None)
+
+
+# Writes the entry (KEYS[1]) only if the code's generation (KEYS[2]) is still
+# the one read before the lookup it was filled from.
+FILL_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+class SharedRedirectCache:
+    """Dragonfly-backed redirect cache shared by every API replica.
+
+    Unknown codes are cached as short-lived negative entries so repeated
+    probes for missing links do not reach Postgres. Cache failures are logged
+    and treated as misses. When disabled every lookup is a miss and writes
+    are skipped.
+
+    Every invalidation bumps the code's generation. :meth:`get` returns the
+    generation along with the entry and a fill passes it back, so a fill
+    that read Postgres before a change was committed and invalidated cannot
+    store the old target afterwards.
+    """
+
+    prefix = "redirect:"
+    generation_prefix = "redirect-generation:"
+    # Only has to outlive the lookups that read a generation.
+    generation_ttl = 3600
+
+    def __init__(self, ttl: int, negative_ttl: int, enabled: bool = True) -> None:
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.enabled = enabled
+        self._fill = redis_client.register_script(FILL_SCRIPT)
+
+    async def get(self, code: str) -> Tuple[Optional[SharedRedirect], str]:
+        """The entry for ``code`` (None on a miss) and its generation, to pass
+        to :meth:`set` or :meth:`set_missing` when filling a miss."""
+        if not self.enabled:
+            return None, ""
+        try:
+            raw, generation = await redis_client.mget(
+                self.prefix + code, self.generation_prefix + code
+            )
+        except RedisError:
+            logger.warning("Shared redirect cache unavailable")
+            return None, ""
+        generation = generation or ""
+        if raw is None:
+            return None, generation
+        if raw == "":
+            return NOT_FOUND, generation
+        # Entries written before links had cache policies have no flags.
+        short_url_id, original_url, expires_at, *policy = json.loads(raw)
+        redirect = SharedRedirect(
+            short_url_id,
+            original_url,
+            datetime.fromisoformat(expires_at) if expires_at else None,
+            *policy,
+        )
+        return redirect, generation
+
+    async def set(
+        self,
+        code: str,
+        generation: str,
+        short_url_id: str,
+        original_url: str,
+        expires_at: Optional[datetime],
+        is_permanent: bool = False,
+        analytics_enabled: bool = True,
+    ) -> bool:
+        """Cache the link read after :meth:`get` returned ``generation``.
+        False if ``code`` was invalidated since, and the link may be stale."""
+        if not self.enabled:
+            return True
+        value = json.dumps(
+            [
+                short_url_id,
+                original_url,
+                expires_at.isoformat() if expires_at else None,
+                is_permanent,
+                analytics_enabled,
+            ]
+        )
+        return await self._set(code, generation, value, self.ttl)
+
+    async def set_missing(self, code: str, generation: str) -> None:
+        if self.enabled:
+            await self._set(code, generation, "", self.negative_ttl)
+
+    async def _set(self, code: str, generation: str, value: str, ttl: int) -> bool:
+        try:
+            keys = [self.prefix + code, self.generation_prefix + code]
+            return bool(await self._fill(keys=keys, args=[generation, value, ttl]))
+        except RedisError:
+            logger.warning("Shared redirect cache unavailable")
+            return True
+
+    async def invalidate(self, *codes: str) -> None:
+        """Drop ``codes`` from the shared tier and from every replica's local cache."""
+        if self.enabled:
+            try:
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    pipe.delete(*(self.prefix + code for code in codes))
+                    for code in codes:
+                        pipe.incr(self.generation_prefix + code)
+                        pipe.expire(self.generation_prefix + code, self.generation_ttl)
+                    await pipe.execute()
+            except RedisError:
+                logger.warning("Shared redirect cache unavailable")
+        await publish_invalidation("redirect", codes)
+
+
+shared_redirect_cache = SharedRedirectCache(
+    ttl=settings.SHARED_CACHE_TTL,
+    negative_ttl=settings.NEGATIVE_CACHE_TTL,
+    enabled=settings.SHARED_CACHE_ENABLED,
+)
+
+register_invalidation_handler("redirect", redirect_cache.invalidate)
@@ -0,0 +1,69 @@
+import logging
+import time
+from typing import Dict, Optional
+
+from API.config import settings
+from API.db import redis_client
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+
+class UserVersions:
+    """Per-user version counters in Dragonfly, used as entity tags.
+
+    ``user_versions`` covers a user's link listing and is bumped after every
+    committed change to it: links created, changed or deleted by the API,
+    visit counts folded and expired links swept by the worker.
+    ``profile_versions`` covers their profile alone, so it is not invalidated
+    every few seconds by the visit count folds. A missing
+    counter starts from the current time in nanoseconds, not from zero, so a
+    counter lost to an eviction never returns to a value an earlier response
+    was tagged with.
+
+    Without the shared cache the counters are process-local, which is only
+    correct for a single process. When Dragonfly fails :meth:`get` returns
+    None and responses go out untagged.
+    """
+
+    def __init__(self, prefix: str, enabled: bool = True) -> None:
+        self.prefix = prefix
+        self.enabled = enabled
+        self._local: Dict[str, int] = {}
+
+    async def get(self, user_id: str) -> Optional[int]:
+        """Current version of ``user_id`` (hex); read it before the data it tags."""
+        if not self.enabled:
+            return self._local.setdefault(user_id, time.time_ns())
+        key = self.prefix + user_id
+        try:
+            version = await redis_client.get(key)
+            if version is None:
+                await redis_client.set(key, time.time_ns(), nx=True)
+                version = await redis_client.get(key)
+        except RedisError:
+            logger.warning("User versions unavailable")
+            return None
+        return None if version is None else int(version)
+
+    async def bump(self, *user_ids: str) -> None:
+        if not user_ids:
+            return
+        if not self.enabled:
+            for user_id in user_ids:
+                self._local[user_id] = self._local.get(user_id, time.time_ns()) + 1
+            return
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    pipe.set(self.prefix + user_id, time.time_ns(), nx=True)
+                    pipe.incr(self.prefix + user_id)
+                await pipe.execute()
+        except RedisError:
+            logger.warning("Could not bump the versions of %d users", len(user_ids))
+
+
+user_versions = UserVersions("user-version:", enabled=settings.SHARED_CACHE_ENABLED)
+profile_versions = UserVersions(
+    "profile-version:", enabled=settings.SHARED_CACHE_ENABLED
+)
@@ -1 +1,2 @@
-from .tasks import prepare_report
+from .buffer import VisitEventBuffer, visit_buffer
+from .tasks import prepare_report, prepare_reports
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, List
+
+from API.config import settings
+from API.db import redis_client
+
+from .tasks import prepare_reports
+
+logger = logging.getLogger(__name__)
+
+
+class VisitEventBuffer:
+    """Bounded in-process queue of visit events drained to the broker in batches.
+
+    Producers append in O(1) without touching the broker. A background task
+    (:meth:`run`) sends up to ``batch_size`` events per Celery message from a
+    dedicated thread, so a slow broker never blocks the event loop, or with
+    ``transport="stream"`` appends them as one entry to the ``stream`` read
+    by the worker's visit consumer. When the
+    buffer is full, events are dropped immediately (``policy="drop"``) or
+    after waiting up to ``block_timeout`` seconds for room (``policy="block"``).
+    """
+
+    def __init__(
+        self,
+        max_events: int,
+        batch_size: int,
+        flush_interval: float,
+        policy: str = "drop",
+        block_timeout: float = 0.0,
+        transport: str = "celery",
+        stream: str = "visits",
+        stream_maxlen: int = 10000,
+    ) -> None:
+        self.max_events = max_events
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.transport = transport
+        self.stream = stream
+        self.stream_maxlen = stream_maxlen
+        self._events: Deque[dict] = deque()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="visit-events"
+        )
+        self.enqueued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.batches = 0
+        self.failures = 0
+
+    def offer(self, event: dict) -> bool:
+        """Append ``event`` if there is room; never waits."""
+        if len(self._events) >= self.max_events:
+            return False
+        self._events.append(event)
+        self.enqueued += 1
+        self._ready.set()
+        return True
+
+    async def put(self, event: dict) -> bool:
+        """Append ``event`` honouring the overflow policy; returns False if dropped."""
+        if self.offer(event):
+            return True
+        if self.policy == "block" and self.block_timeout > 0:
+            try:
+                await asyncio.wait_for(self._wait_for_space(event), self.block_timeout)
+                return True
+            except asyncio.TimeoutError:
+                pass
+        self.dropped += 1
+        return False
+
+    async def _wait_for_space(self, event: dict) -> None:
+        while True:
+            self._space.clear()
+            await self._space.wait()
+            if self.offer(event):
+                return
+
+    def _take_batch(self) -> List[dict]:
+        events = self._events
+        return [events.popleft() for _ in range(min(self.batch_size, len(events)))]
+
+    async def flush(self) -> None:
+        batch = self._take_batch()
+        if not batch:
+            return
+        self._space.set()
+        try:
+            await self._send(batch)
+        except Exception:
+            self.failures += 1
+            logger.exception("Failed to send %d visit events", len(batch))
+            room = self.max_events - len(self._events)
+            if room > 0:
+                self._events.extendleft(reversed(batch[-room:]))
+            self.dropped += max(0, len(batch) - max(room, 0))
+            raise
+        self.sent += len(batch)
+        self.batches += 1
+
+    async def _send(self, batch: List[dict]) -> None:
+        if self.transport == "stream":
+            await redis_client.xadd(
+                self.stream,
+                {"events": json.dumps(batch)},
+                maxlen=self.stream_maxlen,
+                approximate=True,
+            )
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, prepare_reports.delay, batch)
+
+    async def run(self) -> None:
+        """Drain the buffer until cancelled."""
+        while True:
+            if not self._events:
+                self._ready.clear()
+                await self._ready.wait()
+            if len(self._events) < self.batch_size:
+                await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(1)
+
+    async def close(self) -> None:
+        """Send whatever is still buffered, then release the sender thread."""
+        try:
+            while self._events:
+                await self.flush()
+        except Exception:
+            logger.warning("Dropping %d visit events on shutdown", len(self._events))
+            self.dropped += len(self._events)
+            self._events.clear()
+        self._executor.shutdown(wait=True)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._events),
+            "max_events": self.max_events,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "sent": self.sent,
+            "batches": self.batches,
+            "failures": self.failures,
+        }
+
+
+visit_buffer = VisitEventBuffer(
+    max_events=settings.VISIT_BUFFER_SIZE,
+    batch_size=settings.VISIT_BUFFER_BATCH_SIZE,
+    flush_interval=settings.VISIT_BUFFER_FLUSH_INTERVAL,
+    policy=settings.VISIT_BUFFER_POLICY,
+    block_timeout=settings.VISIT_BUFFER_BLOCK_TIMEOUT,
+    transport=settings.VISIT_TRANSPORT,
+    stream=settings.VISIT_STREAM,
+    stream_maxlen=settings.VISIT_STREAM_MAXLEN,
+)
@@ -7,8 +7,15 @@ app.conf.task_serializer = "json"
 app.conf.result_serializer = "json"
 app.conf.accept_content = ["json"]
 app.conf.enable_utc = True
+# Nothing reads task results back; storing them only loads the backend.
+app.conf.task_ignore_result = True
 
 
 @app.task(name="test")
 def prepare_report(load:dict) -> dict:
     return load
+
+
+@app.task(name="visits.batch")
+def prepare_reports(loads: list) -> None:
+    pass
@@ -1,2 +1,14 @@
-from .connection import get_async_session, init_db
-from .models import ShortURL, User, Visit
+from .connection import (
+    CODE_SEQUENCE,
+    async_session_maker,
+    engine,
+    get_async_session,
+    init_db,
+    query_stats,
+    redis_client,
+    replica_router,
+    upgrade_indexes_online,
+)
+from .instrumentation import QueryStats
+from .models import ShortURL, User, Visit, VisitCountFold, VisitDaily, VisitHourly
+from .routing import Replica, ReplicaRouter
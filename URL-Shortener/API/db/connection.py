@@ -1,19 +1,50 @@
 from typing import Any, AsyncGenerator
 
 from API.config import settings
+from API.db.instrumentation import InstrumentedQueuePool, QueryStats
+from API.db.partitions import (
+    ensure_visit_partitions,
+    move_unpartitioned_visits,
+    set_aside_unpartitioned_visits,
+)
+from API.db.routing import ReplicaRouter
+from redis.asyncio import Redis
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.asyncio.engine import AsyncEngine
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-engine: AsyncEngine = create_async_engine(
-    url=settings.POSTGRES_URL_ASYNC,
-    echo=True,
-    pool_size=settings.POOL_SIZE,
-    max_overflow=settings.MAX_OVERFLOW,
-    pool_timeout=settings.POOL_TIMEOUT,
-    pool_recycle=settings.POOL_RECYCLE,
-    pool_pre_ping=True,
+query_stats = QueryStats(
+    slow_threshold=settings.SLOW_QUERY_THRESHOLD_MS / 1000,
+    slow_sample_rate=settings.SLOW_QUERY_SAMPLE_RATE,
+)
+
+
+def create_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url=url,
+        echo=settings.SQL_ECHO,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.POOL_SIZE,
+        max_overflow=settings.MAX_OVERFLOW,
+        pool_timeout=settings.POOL_TIMEOUT,
+        pool_recycle=settings.POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+    query_stats.attach(engine)
+    return engine
+
+
+engine: AsyncEngine = create_engine(settings.POSTGRES_URL_ASYNC)
+
+replica_router = ReplicaRouter(
+    primary=engine,
+    replicas=[create_engine(url) for url in settings.POSTGRES_REPLICA_URLS],
+    selection=settings.REPLICA_SELECTION,
+    max_lag=settings.REPLICA_MAX_LAG,
+    check_interval=settings.REPLICA_CHECK_INTERVAL,
+    read_your_writes_window=settings.READ_YOUR_WRITES_WINDOW,
 )
 
 async_session_maker = async_sessionmaker(
@@ -21,6 +52,9 @@ async_session_maker = async_sessionmaker(
 )
 
 
+redis_client: Redis = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+
 async def get_async_session() -> AsyncGenerator[AsyncSession, Any]:
     """Dependency function that yields an async session."""
     async with async_session_maker() as session:
@@ -31,11 +65,98 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, Any]:
             raise
 
 
+# Sequence backing the "sequence" short code allocator. Its increment is the
+# size of the id blocks leased by each process and must not be lowered later.
+CODE_SEQUENCE = "shorturl_code_seq"
+
+# Idempotent DDL for tables that already existed before a change to their
+# model; create_all only handles missing tables.
+SCHEMA_UPGRADES = [
+    "CREATE INDEX IF NOT EXISTS ix_shorturl_expires_at ON shorturl (expires_at)",
+    "CREATE INDEX IF NOT EXISTS ix_shorturl_user_id_id ON shorturl (user_id, id)",
+    "ALTER TABLE visitdaily ADD COLUMN IF NOT EXISTS visitors bytea",
+    # Widened from 100 characters, shorter than most browsers' user agents.
+    # Guarded because even a no-op ALTER locks the busy visit table.
+    "DO $$ BEGIN "
+    "IF (SELECT character_maximum_length FROM information_schema.columns "
+    "WHERE table_schema = current_schema() AND table_name = 'visit' "
+    "AND column_name = 'user_agent') < 512 THEN "
+    "ALTER TABLE visit ALTER COLUMN user_agent TYPE varchar(512); "
+    "END IF; END $$",
+    "ALTER TABLE shorturl ADD COLUMN IF NOT EXISTS is_permanent boolean "
+    "NOT NULL DEFAULT false",
+    "ALTER TABLE shorturl ADD COLUMN IF NOT EXISTS analytics_enabled boolean "
+    "NOT NULL DEFAULT true",
+    f"CREATE SEQUENCE IF NOT EXISTS {CODE_SEQUENCE} "
+    f"INCREMENT BY {settings.SHORT_CODE_BLOCK_SIZE}",
+]
+
+# Index replacements on tables that are already large and in use: (name,
+# CREATE statement, indexes it supersedes). They are built CONCURRENTLY so
+# reads and writes carry on, and the old index is dropped only once the new
+# one is valid.
+ONLINE_INDEX_UPGRADES = [
+    (
+        "ix_shorturl_redirect",
+        "CREATE UNIQUE INDEX CONCURRENTLY ix_shorturl_redirect ON shorturl "
+        "(short_code) INCLUDE (original_url, id, expires_at, is_permanent, "
+        "analytics_enabled)",
+        ["ix_shorturl_short_code", "ix_shorturl_short_code_covering"],
+    ),
+]
+# pg_try_advisory_lock key, so only one of several starting replicas builds.
+ONLINE_UPGRADE_LOCK = 0x5552_4C49_4458
+
+
 async def init_db():
     async with engine.begin() as conn:
         try:
-            from API.db.models import User,Visit,ShortURL
+            from API.db.models import User,Visit,ShortURL,VisitHourly,VisitDaily,VisitCountFold
 
+            # A visit table from before partitioning is rebuilt partitioned.
+            migrating = await set_aside_unpartitioned_visits(conn)
             await conn.run_sync(SQLModel.metadata.create_all)
+            for statement in SCHEMA_UPGRADES:
+                await conn.execute(text(statement))
+            if migrating:
+                await move_unpartitioned_visits(
+                    conn, interval=settings.VISIT_PARTITION_INTERVAL
+                )
+            await ensure_visit_partitions(
+                conn,
+                interval=settings.VISIT_PARTITION_INTERVAL,
+                ahead=settings.VISIT_PARTITIONS_AHEAD,
+            )
         except Exception:
             raise
+
+
+async def upgrade_indexes_online() -> None:
+    """Apply ONLINE_INDEX_UPGRADES; safe to run while the API serves traffic.
+
+    CONCURRENTLY cannot run inside a transaction, so this uses an autocommit
+    connection. An index left invalid by an interrupted build is dropped and
+    built again.
+    """
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        lock = {"key": ONLINE_UPGRADE_LOCK}
+        if not await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), lock):
+            return
+        try:
+            for name, create, superseded in ONLINE_INDEX_UPGRADES:
+                valid = await conn.scalar(
+                    text(
+                        "SELECT indisvalid FROM pg_index "
+                        "WHERE indexrelid = to_regclass(:name)"
+                    ),
+                    {"name": name},
+                )
+                if valid is False:
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                if not valid:
+                    await conn.execute(text(create))
+                for old in superseded:
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {old}"))
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), lock)
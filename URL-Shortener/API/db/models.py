@@ -3,8 +3,8 @@ from datetime import datetime
 from typing import Optional
 
 from pydantic import EmailStr
-from sqlalchemy import Column, DateTime, ForeignKey, Integer
-from sqlalchemy.dialects.postgresql import TEXT, UUID
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer
+from sqlalchemy.dialects.postgresql import BYTEA, TEXT, UUID
 from sqlmodel import Boolean, Field, SQLModel, String, text
 
 
@@ -88,6 +88,26 @@ class User(SQLModel, table=True):
 
 
 class ShortURL(SQLModel, table=True):
+    __table_args__ = (
+        # Serves keyset pagination of a user's links (newest first by uuidv7 id).
+        Index("ix_shorturl_user_id_id", "user_id", "id"),
+        # Enforces unique codes and carries everything a redirect reads, so
+        # lookups are index-only scans. original_url is capped at 2083
+        # characters by HttpUrl, well below the B-tree tuple size limit.
+        Index(
+            "ix_shorturl_redirect",
+            "short_code",
+            unique=True,
+            postgresql_include=[
+                "original_url",
+                "id",
+                "expires_at",
+                "is_permanent",
+                "analytics_enabled",
+            ],
+        ),
+    )
+
     id: uuid.UUID = Field(
         sa_column=Column(
             UUID(as_uuid=True),
@@ -110,8 +130,6 @@ class ShortURL(SQLModel, table=True):
         sa_column=Column(
             String(12),
             nullable=False,
-            unique=True,
-            index=True,
             comment="Generated slug (e.g. aB78xZ)",
         ),
     )
@@ -151,12 +169,37 @@ class ShortURL(SQLModel, table=True):
         sa_column=Column(
             DateTime(timezone=True),
             nullable=True,
+            index=True,
             comment="Optional expiration timestamp",
         ),
     )
 
+    is_permanent: bool = Field(
+        default=False,
+        sa_column=Column(
+            Boolean(),
+            nullable=False,
+            server_default=text("false"),
+            comment="Redirect with 308 instead of 307",
+        ),
+    )
+
+    analytics_enabled: bool = Field(
+        default=True,
+        sa_column=Column(
+            Boolean(),
+            nullable=False,
+            server_default=text("true"),
+            comment="Record visits; redirects are then never cacheable",
+        ),
+    )
+
 
 class Visit(SQLModel, table=True):
+    # Range-partitioned on visited_at; partitions are managed by
+    # API.db.partitions. The partition key has to be part of the primary key.
+    __table_args__ = {"postgresql_partition_by": "RANGE (visited_at)"}
+
     id: uuid.UUID = Field(
         sa_column=Column(
             UUID(as_uuid=True),
@@ -180,6 +223,7 @@ class Visit(SQLModel, table=True):
     visited_at: datetime = Field(
         sa_column=Column(
             DateTime(timezone=True),
+            primary_key=True,
             nullable=False,
             server_default=text("CURRENT_TIMESTAMP"),
             comment="Timestamp of the visit",
@@ -196,8 +240,101 @@ class Visit(SQLModel, table=True):
 
     user_agent: str = Field(
         sa_column=Column(
-            String(100),
+            String(512),
             nullable=False,
             comment="User-Agent header text",
         )
     )
+
+
+class VisitHourly(SQLModel, table=True):
+    short_url_id: uuid.UUID = Field(
+        sa_column=Column(
+            UUID(as_uuid=True),
+            ForeignKey("shorturl.id", ondelete="CASCADE"),
+            primary_key=True,
+            nullable=False,
+            comment="FK to ShortURL.id",
+        )
+    )
+
+    bucket: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            primary_key=True,
+            nullable=False,
+            comment="Start of the hour (UTC)",
+        )
+    )
+
+    visits: int = Field(
+        sa_column=Column(
+            Integer,
+            nullable=False,
+            server_default=text("0"),
+            comment="Number of visits in the hour",
+        )
+    )
+
+
+class VisitDaily(SQLModel, table=True):
+    short_url_id: uuid.UUID = Field(
+        sa_column=Column(
+            UUID(as_uuid=True),
+            ForeignKey("shorturl.id", ondelete="CASCADE"),
+            primary_key=True,
+            nullable=False,
+            comment="FK to ShortURL.id",
+        )
+    )
+
+    bucket: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            primary_key=True,
+            nullable=False,
+            comment="Start of the day (UTC)",
+        )
+    )
+
+    visits: int = Field(
+        sa_column=Column(
+            Integer,
+            nullable=False,
+            server_default=text("0"),
+            comment="Number of visits in the day",
+        )
+    )
+
+    visitors: Optional[bytes] = Field(
+        default=None,
+        sa_column=Column(
+            BYTEA,
+            nullable=True,
+            comment="HyperLogLog sketch of the day's distinct visitors",
+        ),
+    )
+
+
+class VisitCountFold(SQLModel, table=True):
+    # Folds of the Dragonfly visit counters already applied to
+    # ShortURL.visit_count, so a retried fold is not counted twice.
+
+    id: uuid.UUID = Field(
+        sa_column=Column(
+            UUID(as_uuid=True),
+            primary_key=True,
+            nullable=False,
+            comment="Id of the counter snapshot",
+        )
+    )
+
+    folded_at: datetime = Field(
+        sa_column=Column(
+            DateTime(timezone=True),
+            nullable=False,
+            server_default=text("CURRENT_TIMESTAMP"),
+            index=True,
+            comment="When the snapshot was applied",
+        )
+    )
@@ -0,0 +1,227 @@
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+"""
+Maintenance of the range partitions of the ``visit`` table.
+
+Partitions are named ``visit_pYYYYMMDD`` (daily) or ``visit_pYYYYMM`` (monthly)
+after the start of the range they cover, which is all that is needed to find
+the ones past the retention period. A plain ``visit`` table left from before
+partitioning is rebuilt by the API on startup (see API.db.connection.init_db).
+
+The worker runs an identical copy; see check_copies.py.
+"""
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "visit"
+PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_p(\d{{6}}|\d{{8}})$")
+# A plain visit table from before partitioning, while its rows are moved.
+UNPARTITIONED_TABLE = f"{PARENT_TABLE}_unpartitioned"
+# pg_advisory_xact_lock key, so only one of several starting replicas migrates.
+MIGRATION_LOCK = 0x5552_4C50_4152
+
+
+def partition_start(moment: datetime, interval: str) -> datetime:
+    start = moment.astimezone(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return start.replace(day=1) if interval == "month" else start
+
+
+def next_partition_start(start: datetime, interval: str) -> datetime:
+    if interval == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def partition_name(start: datetime, interval: str) -> str:
+    suffix = start.strftime("%Y%m" if interval == "month" else "%Y%m%d")
+    return f"{PARENT_TABLE}_p{suffix}"
+
+
+async def relkind(conn: AsyncConnection, table: str) -> Optional[str]:
+    return await conn.scalar(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": table},
+    )
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    return await relkind(conn, PARENT_TABLE) == "p"
+
+
+async def create_partitions(
+    conn: AsyncConnection, start: datetime, end: datetime, interval: str
+) -> List[str]:
+    """Create the missing partitions covering ``[start, end)``; returns the
+    names of all partitions in that range."""
+    start = partition_start(start, interval)
+    names = []
+    while start < end:
+        stop = next_partition_start(start, interval)
+        name = partition_name(start, interval)
+        await conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{stop.isoformat()}')"
+            )
+        )
+        names.append(name)
+        start = stop
+    return names
+
+
+async def set_aside_unpartitioned_visits(conn: AsyncConnection) -> bool:
+    """
+    Rename a plain ``visit`` table out of the way, so that create_all builds
+    the partitioned one, and drop its indexes, whose names the new table
+    reuses. Returns whether there was one; :func:`move_unpartitioned_visits`
+    then moves its rows over in the same transaction.
+    """
+    if await relkind(conn, PARENT_TABLE) != "r":
+        return False
+    await conn.execute(
+        text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK}
+    )
+    # Another replica may have migrated while we waited for the lock.
+    if await relkind(conn, PARENT_TABLE) != "r":
+        return False
+    await conn.execute(
+        text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {UNPARTITIONED_TABLE}")
+    )
+    indexes = await conn.execute(
+        text(
+            "SELECT i.relname, c.conname FROM pg_index x "
+            "JOIN pg_class i ON i.oid = x.indexrelid "
+            "LEFT JOIN pg_constraint c "
+            "ON c.conindid = x.indexrelid AND c.conrelid = x.indrelid "
+            "WHERE x.indrelid = to_regclass(:table)"
+        ),
+        {"table": UNPARTITIONED_TABLE},
+    )
+    for index, constraint in indexes.all():
+        if constraint is not None:
+            await conn.execute(
+                text(
+                    f"ALTER TABLE {UNPARTITIONED_TABLE} "
+                    f'DROP CONSTRAINT "{constraint}"'
+                )
+            )
+        else:
+            await conn.execute(text(f'DROP INDEX "{index}"'))
+    logger.warning("Migrating table %r to range partitions", PARENT_TABLE)
+    return True
+
+
+async def move_unpartitioned_visits(
+    conn: AsyncConnection, interval: str, now: Optional[datetime] = None
+) -> int:
+    """
+    Copy the rows of the table set aside by :func:`set_aside_unpartitioned_visits`
+    into the partitioned ``visit``, creating the partitions they need, and drop
+    it. Returns the number of rows moved. Runs in the caller's transaction, so
+    the table stays locked until the whole migration commits.
+    """
+    if await relkind(conn, UNPARTITIONED_TABLE) != "r":
+        return 0
+    oldest, newest = (
+        await conn.execute(
+            text(f"SELECT min(visited_at), max(visited_at) FROM {UNPARTITIONED_TABLE}")
+        )
+    ).one()
+    if oldest is not None:
+        last = partition_start(max(newest, now or datetime.now(timezone.utc)), interval)
+        end = next_partition_start(last, interval)
+        await create_partitions(conn, oldest, end, interval)
+    columns = ", ".join(
+        f'"{column}"'
+        for column in await conn.scalars(
+            text(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = :table "
+                "ORDER BY ordinal_position"
+            ),
+            {"table": UNPARTITIONED_TABLE},
+        )
+    )
+    moved = await conn.execute(
+        text(
+            f"INSERT INTO {PARENT_TABLE} ({columns}) "
+            f"SELECT {columns} FROM {UNPARTITIONED_TABLE}"
+        )
+    )
+    await conn.execute(text(f"DROP TABLE {UNPARTITIONED_TABLE}"))
+    logger.warning("Moved %d visits into the partitioned table", moved.rowcount)
+    return moved.rowcount
+
+
+async def ensure_visit_partitions(
+    conn: AsyncConnection,
+    interval: str,
+    ahead: int,
+    now: Optional[datetime] = None,
+) -> List[str]:
+    """
+    Create the partitions covering the previous, current and next ``ahead``
+    intervals if they do not exist yet. Returns the names of the partitions
+    that were checked.
+    """
+    if not await is_partitioned(conn):
+        logger.warning(
+            "Table %r is not partitioned; restart the API to migrate it",
+            PARENT_TABLE,
+        )
+        return []
+    current = partition_start(now or datetime.now(timezone.utc), interval)
+    # Start one interval back so late events right after a boundary still land.
+    start = partition_start(current - timedelta(days=1), interval)
+    end = current
+    for _ in range(ahead + 1):
+        end = next_partition_start(end, interval)
+    return await create_partitions(conn, start, end, interval)
+
+
+async def drop_expired_visit_partitions(
+    conn: AsyncConnection,
+    retention_days: int,
+    detach_only: bool = False,
+    now: Optional[datetime] = None,
+) -> List[str]:
+    """
+    Detach (and unless ``detach_only``, drop) every partition whose whole
+    range is older than ``retention_days``. Returns the affected partitions.
+    """
+    if retention_days <= 0 or not await is_partitioned(conn):
+        return []
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=retention_days)
+    children = await conn.scalars(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:table)"
+        ),
+        {"table": PARENT_TABLE},
+    )
+    expired = []
+    for name in children:
+        match = PARTITION_NAME.match(name)
+        if match is None:
+            continue
+        suffix = match.group(1)
+        interval = "day" if len(suffix) == 8 else "month"
+        start = datetime.strptime(
+            suffix, "%Y%m%d" if interval == "day" else "%Y%m"
+        ).replace(tzinfo=timezone.utc)
+        if next_partition_start(start, interval) > cutoff:
+            continue
+        await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        if not detach_only:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        expired.append(name)
+    return sorted(expired)
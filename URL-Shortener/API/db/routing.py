@@ -0,0 +1,138 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+"""
+Routing of read-only queries to Postgres streaming replicas, with lag based
+health checks and read-your-writes for users who just changed something.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Seconds of replay lag; zero when the replica has replayed everything it
+# received, even if the primary has been idle for a while.
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class Replica:
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        self.name = f"{engine.url.host}:{engine.url.port or 5432}"
+        # Out of rotation until the first health check passes.
+        self.healthy = False
+        self.lag: Optional[float] = None
+
+    def in_use(self) -> int:
+        return self.engine.sync_engine.pool.checkedout()
+
+
+class ReplicaRouter:
+    """Picks the engine for read-only queries.
+
+    Healthy replicas are chosen round-robin or by fewest checked-out
+    connections; with none healthy, reads go to the primary. Users who
+    committed a write within ``read_your_writes_window`` seconds read from
+    the primary so they never see their own change missing.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: List[AsyncEngine],
+        selection: str = "round_robin",
+        max_lag: float = 5.0,
+        check_interval: float = 5.0,
+        read_your_writes_window: float = 5.0,
+        max_tracked_writers: int = 100_000,
+    ) -> None:
+        self.primary = primary
+        self.replicas = [Replica(engine) for engine in replicas]
+        self.selection = selection
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.read_your_writes_window = read_your_writes_window
+        self.max_tracked_writers = max_tracked_writers
+        self._recent_writers: OrderedDict[str, float] = OrderedDict()
+        self._turn = itertools.count()
+        self.primary_reads = 0
+        self.replica_reads = 0
+
+    def record_write(self, user_id: str) -> None:
+        """Route ``user_id``'s reads to the primary for the next window."""
+        self._recent_writers[user_id] = (
+            time.monotonic() + self.read_your_writes_window
+        )
+        self._recent_writers.move_to_end(user_id)
+        while len(self._recent_writers) > self.max_tracked_writers:
+            self._recent_writers.popitem(last=False)
+
+    def wrote_recently(self, user_id: str) -> bool:
+        until = self._recent_writers.get(user_id)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._recent_writers[user_id]
+            return False
+        return True
+
+    def read_engine(self, user_id: Optional[str] = None) -> AsyncEngine:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy or (user_id is not None and self.wrote_recently(user_id)):
+            self.primary_reads += 1
+            return self.primary
+        self.replica_reads += 1
+        if self.selection == "least_connections":
+            return min(healthy, key=Replica.in_use).engine
+        return healthy[next(self._turn) % len(healthy)].engine
+
+    async def check(self, replica: Replica) -> None:
+        try:
+            async with replica.engine.connect() as conn:
+                lag = await asyncio.wait_for(
+                    conn.scalar(REPLICA_LAG_QUERY), timeout=self.check_interval
+                )
+        except Exception as exc:
+            if replica.healthy:
+                logger.warning("Replica %s failed its health check: %r", replica.name, exc)
+            replica.healthy = False
+            replica.lag = None
+            return
+        replica.lag = float(lag or 0.0)
+        healthy = replica.lag <= self.max_lag
+        if healthy != replica.healthy:
+            logger.warning(
+                "Replica %s %s rotation (lag %.1fs)",
+                replica.name,
+                "joined" if healthy else "left",
+                replica.lag,
+            )
+        replica.healthy = healthy
+
+    async def run(self) -> None:
+        """Check every replica each ``check_interval`` seconds until cancelled."""
+        while True:
+            await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+            await asyncio.sleep(self.check_interval)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "primary_reads": self.primary_reads,
+            "replica_reads": self.replica_reads,
+            "replicas": {
+                replica.name: {
+                    "healthy": replica.healthy,
+                    "lag": replica.lag,
+                    "checked_out": replica.in_use(),
+                }
+                for replica in self.replicas
+            },
+        }
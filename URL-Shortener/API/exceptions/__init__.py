@@ -1,4 +1,4 @@
-from .auth import WrongPassword
+from .auth import PasswordHasherBusy, WrongPassword
 from .db import IntegrityError
-from .url import NOSuchURL
+from .url import NOSuchURL, ShortCodeTaken, URLExpired
 from .user import EmailAlreadyRegistered, UserAlreadyExists
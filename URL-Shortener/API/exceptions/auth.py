@@ -2,3 +2,11 @@ class WrongPassword(Exception):
     def __init__(self, message: str = "Wrong password") -> None:
         super().__init__()
         self.message = message
+
+
+class PasswordHasherBusy(Exception):
+    def __init__(
+        self, message: str = "Too many password operations in progress, retry later"
+    ) -> None:
+        super().__init__()
+        self.message = message
@@ -4,3 +4,15 @@ class NOSuchURL(Exception):
     ) -> None:
         super().__init__()
         self.message = message
+
+
+class URLExpired(Exception):
+    def __init__(self, message: str = "This short URL has expired") -> None:
+        super().__init__()
+        self.message = message
+
+
+class ShortCodeTaken(Exception):
+    def __init__(self, message: str = "Short code is already in use") -> None:
+        super().__init__()
+        self.message = message
@@ -0,0 +1,170 @@
+import json
+import time
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+from API.config import settings
+from API.db import query_stats, replica_router
+from API.exceptions import URLExpired
+from API.services import MainService, redirect_policy
+from API.storage import InMemoryStorage, memory_database
+
+"""
+Raw ASGI handler for ``GET /{code}``. Redirects are most of the traffic and
+need none of FastAPI's machinery: the handler takes the code straight from
+the path, goes through the same caches and visit pipeline as the routed
+endpoint (``MainService.redirect``), looks misses up with one prepared
+statement on a pooled asyncpg connection and sends prebuilt headers.
+Responses are byte-for-byte those of ``API.routes.main.redirect``.
+"""
+
+# Index-only scan on ix_shorturl_redirect.
+REDIRECT_QUERY = (
+    "SELECT id, original_url, expires_at, is_permanent, analytics_enabled "
+    "FROM shorturl WHERE short_code = $1"
+)
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+class _Route(NamedTuple):
+    path: str
+
+
+# Lets MetricsMiddleware label fast path requests like the routed endpoint.
+REDIRECT_ROUTE = _Route("/{code}")
+
+
+def _json_error(status: int, detail: str) -> Tuple[int, Headers, bytes]:
+    # Same encoding as the JSONResponse FastAPI builds for an HTTPException.
+    body = json.dumps(
+        {"detail": detail},
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    headers = [
+        (b"content-length", str(len(body)).encode("latin-1")),
+        (b"content-type", b"application/json"),
+    ]
+    return status, headers, body
+
+
+NOT_FOUND_RESPONSE = _json_error(404, "URL not found")
+
+
+@lru_cache(maxsize=settings.REDIRECT_CACHE_SIZE)
+def _redirect_headers(url: str) -> Headers:
+    # Quoted and ordered like starlette's RedirectResponse, which sets the
+    # location after the other headers.
+    location = quote(url, safe=":/%#?=@[]!$&'()*+,;").encode("latin-1")
+    return [(b"content-length", b"0"), (b"location", location)]
+
+
+async def prepared_redirect_statement(raw):
+    """REDIRECT_QUERY prepared on the pooled connection ``raw``, once per connection."""
+    statement = raw.info.get("redirect_statement")
+    if statement is None:
+        statement = await raw.driver_connection.prepare(REDIRECT_QUERY)
+        raw.info["redirect_statement"] = statement
+    return statement
+
+
+class RawRedirectReader:
+    """The single storage call ``MainService.redirect`` makes, without a session.
+
+    The statement is prepared once per pooled connection and kept in the
+    connection's ``info``. No transaction is opened, so a lookup is one round
+    trip; executions are still accounted in ``query_stats``.
+    """
+
+    async def _fetch(self, engine, short_code: str):
+        async with engine.connect() as conn:
+            statement = await prepared_redirect_statement(
+                await conn.get_raw_connection()
+            )
+            start = time.perf_counter()
+            row = await statement.fetchrow(short_code)
+            query_stats.record(
+                REDIRECT_QUERY, time.perf_counter() - start, 0 if row is None else 1
+            )
+        return row
+
+    async def get_redirect(self, short_code: str):
+        # From the primary, like SQLStorage.get_redirect.
+        return await self._fetch(replica_router.primary, short_code)
+
+
+class RedirectFastPath:
+    """ASGI middleware answering ``GET /{code}`` itself when REDIRECT_FAST_PATH is on.
+
+    ``routes`` is the app's route list; single-segment paths of other routes
+    (``/docs``, ``/metrics``...) are left to the router. The setting is read
+    per request so the benchmark can compare both paths in one process.
+    """
+
+    def __init__(self, app, routes) -> None:
+        self.app = app
+        self.routes = routes
+        self._reserved: Optional[frozenset] = None
+        self.service = MainService()
+        self.reader = RawRedirectReader()
+
+    def reserved(self) -> frozenset:
+        # Computed on first use, once every router has been included.
+        if self._reserved is None:
+            self._reserved = frozenset(
+                route.path
+                for route in self.routes
+                if "{" not in getattr(route, "path", "{")
+                and route.path.count("/") == 1
+            )
+        return self._reserved
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not settings.REDIRECT_FAST_PATH
+            or scope["method"] != "GET"
+        ):
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        if len(path) < 2 or "/" in path[1:] or path in self.reserved():
+            return await self.app(scope, receive, send)
+
+        scope["route"] = REDIRECT_ROUTE
+        client = scope.get("client")
+        user_agent = None
+        for name, value in scope["headers"]:
+            if name == b"user-agent":
+                user_agent = value.decode("latin-1")
+                break
+        user_data = {
+            "ip_address": client[0] if client else None,
+            "user_agent": user_agent,
+        }
+        storage = (
+            self.reader
+            if settings.STORAGE_BACKEND == "sql"
+            else InMemoryStorage(memory_database)
+        )
+        try:
+            redirect = await self.service.redirect(path[1:], user_data, storage)
+        except URLExpired as exc:
+            status, headers, body = _json_error(410, exc.message)
+        else:
+            if redirect is None:
+                status, headers, body = NOT_FOUND_RESPONSE
+            else:
+                status, cache_control = redirect_policy(redirect)
+                headers = _redirect_headers(redirect.original_url)
+                if cache_control is not None:
+                    headers = [
+                        (b"cache-control", cache_control.encode("latin-1")),
+                        *headers,
+                    ]
+                body = b""
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -1,15 +1,48 @@
+import asyncio
 from contextlib import asynccontextmanager
 
-from API.db import init_db
-from API.routes import auth_router, main_router, url_router, user_router
+from API.cache import hot_codes, listen_for_invalidations
+from API.celery import visit_buffer
+from API.config import settings
+from API.db import init_db, redis_client, replica_router, upgrade_indexes_online
+from API.fastpath import RedirectFastPath
+from API.metrics import MetricsMiddleware
+from API.routes import (
+    admin_router,
+    auth_router,
+    health_router,
+    main_router,
+    metrics_router,
+    url_router,
+    user_router,
+)
+from API.warmup import warmup
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_db()
+    if settings.STORAGE_BACKEND == "sql":
+        await init_db()
+    background_tasks = [asyncio.create_task(visit_buffer.run())]
+    if settings.STORAGE_BACKEND == "sql":
+        # Index builds on a populated table can take minutes; serve meanwhile.
+        background_tasks.append(asyncio.create_task(upgrade_indexes_online()))
+    if settings.STORAGE_BACKEND == "sql" and replica_router.replicas:
+        background_tasks.append(asyncio.create_task(replica_router.run()))
+    if settings.SHARED_CACHE_ENABLED:
+        background_tasks.append(asyncio.create_task(listen_for_invalidations()))
+        background_tasks.append(asyncio.create_task(hot_codes.run()))
+    # /readyz answers 503 until the pools and the redirect cache are warm.
+    background_tasks.append(asyncio.create_task(warmup.run()))
     yield
+    warmup.stop()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await visit_buffer.close()
+    await redis_client.aclose()
 
 
 app = FastAPI(
@@ -18,10 +51,18 @@ app = FastAPI(
     version="0.1.0",
     lifespan=lifespan,
 )
+# Added first so MetricsMiddleware also times fast path redirects.
+app.add_middleware(RedirectFastPath, routes=app.routes)
+app.add_middleware(MetricsMiddleware)
 
 
 prefix = "/api/v1"
 app.include_router(user_router, prefix=f"{prefix}/users", tags=["User"])
 app.include_router(auth_router, prefix=f"{prefix}/auth", tags=["Auth"])
 app.include_router(url_router, prefix=f"{prefix}/urls", tags=["URL"])
+app.include_router(admin_router, prefix=f"{prefix}/admin", tags=["Admin"])
+# Registered before main_router so "/metrics", "/healthz" and "/readyz" are
+# not captured by "/{code}".
+app.include_router(metrics_router)
+app.include_router(health_router)
 app.include_router(main_router, tags=["Main"])
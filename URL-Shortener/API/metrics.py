@@ -0,0 +1,69 @@
+import time
+
+from API.prometheus import Counter, Histogram, Registry
+
+"""
+The API's metrics. Updating a metric is a dict lookup and an increment, so it
+can sit on the redirect hot path; values that already live elsewhere (cache,
+buffer and pool statistics) are read by callbacks at scrape time instead of
+being mirrored on every request.
+"""
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route template",
+        labels=("method", "route", "status"),
+    )
+)
+REDIRECTS = REGISTRY.register(
+    Counter(
+        "redirects_total",
+        "Redirect lookups by outcome (local_hit, shared_hit, db_hit, not_found, expired)",
+        labels=("outcome",),
+    )
+)
+VISIT_ENQUEUE_DURATION = REGISTRY.register(
+    Histogram(
+        "visit_event_enqueue_seconds",
+        "Time the redirect path spent handing a visit event to the buffer",
+        buckets=(0.000001, 0.000005, 0.00001, 0.00005, 0.0001, 0.001, 0.01, 0.1),
+    )
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its matched route template.
+
+    Labelling by template (``/{code}``) rather than raw path keeps the number
+    of series bounded however many short codes are requested.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = ["500"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                (
+                    scope["method"],
+                    route.path if route is not None else "<unmatched>",
+                    status[0],
+                ),
+            )
@@ -1,4 +1,7 @@
+from .admin import admin_router
 from .auth import auth_router
+from .health import health_router
 from .main import main_router
+from .metrics import metrics_router
 from .url import url_router
 from .user import user_router
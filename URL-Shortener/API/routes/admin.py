@@ -0,0 +1,41 @@
+from API.cache import hot_codes
+from API.schemas import HotLink, HotLinksSchema, TokenPayload
+from API.services import UserService, validate_token
+from API.storage import Storage, get_storage
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+admin_router = APIRouter()
+
+
+@admin_router.get(
+    "/hot-links",
+    response_model=HotLinksSchema,
+    description="Most redirected links over a recent window (superusers only)",
+)
+async def get_hot_links(
+    minutes: int = Query(5, ge=1, le=1440, description="Window length in minutes"),
+    limit: int = Query(20, ge=1, le=1000),
+    user_service: UserService = Depends(),
+    token: TokenPayload = Depends(validate_token),
+    storage: Storage = Depends(get_storage),
+) -> HotLinksSchema:
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
+        )
+    user = await user_service.get_principal(token.user_id, storage)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    if not user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Superuser access required"
+        )
+    return HotLinksSchema(
+        minutes=minutes,
+        links=[
+            HotLink(short_code=code, redirects=count)
+            for code, count in await hot_codes.top(minutes, limit)
+        ],
+    )
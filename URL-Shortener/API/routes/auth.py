@@ -1,9 +1,13 @@
-from API.db import get_async_session
+from API.exceptions import PasswordHasherBusy
 from API.schemas import TokenResponse
-from API.services import UserService, create_access_token, verify_password
+from API.services import (
+    UserService,
+    create_access_token,
+    verify_and_update_password,
+)
+from API.storage import Storage, get_storage
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel.ext.asyncio.session import AsyncSession
 
 auth_router = APIRouter()
 
@@ -12,14 +16,32 @@ auth_router = APIRouter()
 async def get_token_for_user(
     form_data: OAuth2PasswordRequestForm = Depends(),
     user_service: UserService = Depends(),
-    session: AsyncSession = Depends(get_async_session),
+    storage: Storage = Depends(get_storage),
 ):
-    user = await user_service.get_user_by_email(form_data.username, session)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await user_service.get_user_by_email(form_data.username, storage)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
+    try:
+        valid, new_hash = await verify_and_update_password(
+            form_data.password, user.hashed_password
+        )
+    except PasswordHasherBusy as exp:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=exp.message,
+            headers={"Retry-After": "1"},
+        )
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+        )
+    if new_hash:
+        # Hashing parameters changed since the password was stored.
+        await user_service.update_password_hash(user, new_hash, storage)
 
     access_token = create_access_token(data={"user_id": user.id.hex})
     return TokenResponse(access_token=access_token, token_type="bearer")
@@ -0,0 +1,48 @@
+from hashlib import blake2b
+from typing import Dict, Optional
+
+from API.cache import UserVersions, user_versions
+from fastapi import Request, Response, status
+
+"""
+Conditional GETs for per-user resources. The entity tag is derived from a
+version counter of the user (API.cache.versions) and the query string, so it is
+known before anything is read from Postgres; an unchanged resource costs one
+Dragonfly GET and a 304.
+"""
+
+# Clients may keep the response but must revalidate it before every use.
+CACHE_CONTROL = "private, no-cache"
+
+
+async def user_etag(
+    request: Request, user_id: str, versions: UserVersions = user_versions
+) -> Optional[str]:
+    """Weak entity tag of the resource at ``request`` as seen by ``user_id``,
+    which changes with their counter in ``versions``."""
+    version = await versions.get(user_id)
+    if version is None:
+        return None
+    key = f"{user_id}:{version}:{request.url.query}".encode()
+    return f'W/"{blake2b(key, digest_size=8).hexdigest()}"'
+
+
+def cache_headers(etag: Optional[str]) -> Dict[str, str]:
+    if etag is None:
+        return {"Cache-Control": CACHE_CONTROL}
+    return {"Cache-Control": CACHE_CONTROL, "ETag": etag}
+
+
+def not_modified(request: Request, etag: Optional[str]) -> Optional[Response]:
+    """A 304 response if ``If-None-Match`` names ``etag`` (weak comparison)."""
+    if etag is None:
+        return None
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    if "*" not in tags and etag.removeprefix("W/") not in tags:
+        return None
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag)
+    )
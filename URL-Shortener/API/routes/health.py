@@ -0,0 +1,22 @@
+from API.warmup import warmup
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+health_router = APIRouter()
+
+
+@health_router.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@health_router.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: 503 until the warm-up has finished and again while stopping."""
+    return JSONResponse(
+        {"status": warmup.state},
+        status_code=status.HTTP_200_OK
+        if warmup.ready
+        else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
@@ -1,7 +1,7 @@
-from API.db import get_async_session
-from API.services import MainService
+from API.exceptions import URLExpired
+from API.services import MainService, redirect_policy
+from API.storage import Storage, get_storage
 from fastapi import APIRouter, Depends, HTTPException,Request
-from sqlmodel.ext.asyncio.session import AsyncSession
 from starlette.responses import RedirectResponse
 
 main_router = APIRouter()
@@ -17,10 +17,18 @@ async def redirect(
     code: str,
     request: Request,
     main_service: MainService = Depends(),
-    session: AsyncSession = Depends(get_async_session),
+    storage: Storage = Depends(get_storage),
 ):
     user_data={'ip_address':request.client.host, 'user_agent':request.headers.get('user-agent')}
-    url = await main_service.redirect(code, user_data,session)
+    try:
+        url = await main_service.redirect(code, user_data,storage)
+    except URLExpired as ext:
+        raise HTTPException(status_code=410, detail=ext.message)
     if url is None:
         raise HTTPException(status_code=404, detail="URL not found")
-    return RedirectResponse(url=url, status_code=307)
+    status_code, cache_control = redirect_policy(url)
+    return RedirectResponse(
+        url=url.original_url,
+        status_code=status_code,
+        headers=None if cache_control is None else {"Cache-Control": cache_control},
+    )
@@ -0,0 +1,181 @@
+from API.cache import hot_codes, principal_cache, redirect_cache
+from API.celery import visit_buffer
+from API.db import engine, query_stats, replica_router
+from API.metrics import REGISTRY
+from API.prometheus import Collected, CollectedHistogram
+from API.warmup import warmup
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+metrics_router = APIRouter()
+
+
+def _pool_stats() -> dict:
+    pool = engine.sync_engine.pool
+    return {
+        ("size",): pool.size(),
+        ("checked_out",): pool.checkedout(),
+        ("checked_in",): pool.checkedin(),
+        # QueuePool counts overflow from -pool_size; only report real overflow.
+        ("overflow",): max(pool.overflow(), 0),
+    }
+
+
+def _stats_items(stats: dict, keys) -> dict:
+    return {(key,): stats[key] for key in keys}
+
+
+REGISTRY.register(
+    Collected(
+        "db_pool_connections",
+        "Connection pool occupancy",
+        _pool_stats,
+        labels=("state",),
+    )
+)
+REGISTRY.register(
+    CollectedHistogram(
+        "db_pool_wait_seconds",
+        "Time spent waiting to check a connection out of the pool",
+        lambda: {(): query_stats.pool_wait},
+    )
+)
+REGISTRY.register(
+    Collected(
+        "db_slow_queries_total",
+        "Statements slower than SLOW_QUERY_THRESHOLD_MS",
+        lambda: {(): query_stats.slow_queries},
+        kind="counter",
+    )
+)
+REGISTRY.register(
+    Collected(
+        "db_replica_lag_seconds",
+        "Replay lag of each read replica at its last health check",
+        lambda: {
+            (replica.name,): replica.lag
+            for replica in replica_router.replicas
+            if replica.lag is not None
+        },
+        labels=("replica",),
+    )
+)
+REGISTRY.register(
+    Collected(
+        "db_replica_healthy",
+        "1 while a read replica is in rotation",
+        lambda: {
+            (replica.name,): int(replica.healthy) for replica in replica_router.replicas
+        },
+        labels=("replica",),
+    )
+)
+REGISTRY.register(
+    Collected(
+        "db_read_sessions_total",
+        "Sessions for read-only queries, by the server they were routed to",
+        lambda: {
+            ("primary",): replica_router.primary_reads,
+            ("replica",): replica_router.replica_reads,
+        },
+        labels=("target",),
+        kind="counter",
+    )
+)
+REGISTRY.register(
+    Collected(
+        "redirect_cache_events_total",
+        "Local redirect cache lookups, removals and rejected admissions",
+        lambda: _stats_items(
+            redirect_cache.stats(),
+            (
+                "hits",
+                "misses",
+                "evictions",
+                "expirations",
+                "invalidations",
+                "rejections",
+            ),
+        ),
+        labels=("event",),
+        kind="counter",
+    )
+)
+REGISTRY.register(
+    Collected(
+        "redirect_cache_entries",
+        "Entries held in the local redirect cache",
+        lambda: {(): len(redirect_cache)},
+    )
+)
+REGISTRY.register(
+    Collected(
+        "hot_codes_tracked",
+        "Codes this replica counts exactly for the shared hot code ranking",
+        lambda: {(): len(hot_codes.tracked)},
+    )
+)
+REGISTRY.register(
+    Collected(
+        "hot_codes_flushes_total",
+        "Publications of hot code counts to Dragonfly, by result",
+        lambda: {("ok",): hot_codes.flushes, ("failed",): hot_codes.failures},
+        labels=("result",),
+        kind="counter",
+    )
+)
+REGISTRY.register(
+    Collected(
+        "principal_cache_lookups_total",
+        "Authenticated principal cache lookups",
+        lambda: _stats_items(principal_cache.stats(), ("hits", "misses")),
+        labels=("result",),
+        kind="counter",
+    )
+)
+REGISTRY.register(
+    Collected(
+        "visit_buffer_events_total",
+        "Visit events passing through the in-process buffer",
+        lambda: _stats_items(visit_buffer.stats(), ("enqueued", "dropped", "sent")),
+        labels=("event",),
+        kind="counter",
+    )
+)
+REGISTRY.register(
+    Collected(
+        "visit_buffer_batches_total",
+        "Visit batches handed to the broker, by result",
+        lambda: {
+            ("sent",): visit_buffer.batches,
+            ("failed",): visit_buffer.failures,
+        },
+        labels=("result",),
+        kind="counter",
+    )
+)
+REGISTRY.register(
+    Collected(
+        "visit_buffer_depth",
+        "Visit events waiting to be sent",
+        lambda: {(): len(visit_buffer)},
+    )
+)
+REGISTRY.register(
+    Collected(
+        "api_ready",
+        "1 once the startup warm-up has finished, 0 while warming or stopping",
+        lambda: {(): int(warmup.ready)},
+    )
+)
+
+
+@metrics_router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+)
+async def metrics():
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4"
+    )
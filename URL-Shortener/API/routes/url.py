@@ -1,46 +1,104 @@
-from typing import Optional
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Literal, Optional, Union
+from uuid import UUID
 
-from API.db import get_async_session
+from API.config import settings
 from API.exceptions import IntegrityError, NOSuchURL
 from API.schemas import (
+    BulkItemError,
+    BulkURLCreatedItem,
+    BulkURLCreatedResponseSchema,
+    BulkURLCreationSchema,
+    StatsBucket,
     TokenPayload,
     URLCreatedResponseSchema,
     URLCreationSchema,
     URLInfo,
     URLsSchema,
+    URLStatsSchema,
     URLUpdateSchema,
 )
 from API.services import URLServices, UserService, validate_token
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel.ext.asyncio.session import AsyncSession
+from API.storage import Storage, get_storage
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+
+from .conditional import cache_headers, not_modified, user_etag
 
 url_router = APIRouter()
 
 
+def short_url(code: str) -> str:
+    """The public URL redirecting to the link ``code``."""
+    return settings.SHORT_URL_BASE + code
+
+
+def encode_cursor(after: UUID) -> str:
+    return base64.urlsafe_b64encode(after.bytes).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> UUID:
+    try:
+        return UUID(bytes=base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+def ndjson_line(url) -> bytes:
+    return (
+        json.dumps(
+            {
+                "id": str(url.id),
+                "short_url": short_url(url.short_code),
+                "original_url": url.original_url,
+                "short_code": url.short_code,
+                "visit_count": url.visit_count,
+                "created_at": url.created_at.isoformat(),
+                "expires_at": url.expires_at.isoformat() if url.expires_at else None,
+                "is_permanent": url.is_permanent,
+                "analytics_enabled": url.analytics_enabled,
+            }
+        )
+        + "\n"
+    ).encode()
+
+
+# Range returned by the stats endpoint when "from" is omitted.
+DEFAULT_STATS_RANGE = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+
+
 @url_router.post("/", response_model=URLCreatedResponseSchema, description="")
 async def shorten_url(
     url_data: URLCreationSchema,
     url_service: URLServices = Depends(),
     user_service: UserService = Depends(),
     token: Optional[TokenPayload] = Depends(validate_token),
-    session: AsyncSession = Depends(get_async_session),
+    storage: Storage = Depends(get_storage),
 ) -> URLCreatedResponseSchema:
     user = None
     if token is not None:
-        user = await user_service.get_user_by_id(token.user_id, session)
+        user = await user_service.get_principal(token.user_id, storage)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
             )
     try:
-        url = await url_service.create_url(url_data, user, session)
+        url = await url_service.create_url(url_data, user, storage)
         return URLCreatedResponseSchema(
             id=url.id,
             short_code=str(url.short_code),
             original_url=url.original_url,
-            short_url="http://localhost:8000/" + str(url.short_code),
+            short_url=short_url(url.short_code),
             created_at=url.created_at,
             expires_at=url.expires_at,
+            is_permanent=url.is_permanent,
+            analytics_enabled=url.analytics_enabled,
         )
     except IntegrityError as exp:
         raise HTTPException(
@@ -48,36 +106,129 @@ async def shorten_url(
         )
 
 
+@url_router.post(
+    "/bulk",
+    response_model=BulkURLCreatedResponseSchema,
+    description="Shorten many URLs at once; invalid items are reported, not fatal",
+)
+async def shorten_urls(
+    bulk_data: BulkURLCreationSchema,
+    url_service: URLServices = Depends(),
+    user_service: UserService = Depends(),
+    token: Optional[TokenPayload] = Depends(validate_token),
+    storage: Storage = Depends(get_storage),
+) -> BulkURLCreatedResponseSchema:
+    if len(bulk_data.items) > settings.BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.BULK_MAX_ITEMS} items per request",
+        )
+    user = None
+    if token is not None:
+        user = await user_service.get_principal(token.user_id, storage)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+            )
+    valid: list[tuple[int, URLCreationSchema]] = []
+    errors: list[BulkItemError] = []
+    for index, item in enumerate(bulk_data.items):
+        try:
+            valid.append((index, URLCreationSchema.model_validate(item)))
+        except ValidationError as exp:
+            errors.append(
+                BulkItemError(
+                    index=index,
+                    detail="; ".join(error["msg"] for error in exp.errors()),
+                )
+            )
+    created = []
+    if valid:
+        try:
+            created = await url_service.create_urls(
+                [url_data for _, url_data in valid], user, storage
+            )
+        except IntegrityError:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Intern db error",
+            )
+    return BulkURLCreatedResponseSchema(
+        created=[
+            BulkURLCreatedItem(
+                index=valid[position][0],
+                id=url.id,
+                short_code=str(url.short_code),
+                original_url=url.original_url,
+                short_url=short_url(url.short_code),
+                created_at=url.created_at,
+                expires_at=url.expires_at,
+                is_permanent=url.is_permanent,
+                analytics_enabled=url.analytics_enabled,
+            )
+            for position, url in created
+        ],
+        errors=errors,
+    )
+
+
 @url_router.get(
     "/all",
     response_model=URLsSchema,
-    description="List of shortened URLs created by the user",
+    description="List of shortened URLs created by the user, newest first. Pass "
+    "the returned 'next' cursor to get the following page, or format=ndjson to "
+    "stream every link as newline-delimited JSON. Responses carry an ETag; "
+    "send it back in If-None-Match to get 304 Not Modified while nothing changed.",
 )
 async def get_urls(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
     token: TokenPayload = Depends(validate_token),
     url_service: URLServices = Depends(),
     user_service: UserService = Depends(),
-    session: AsyncSession = Depends(get_async_session),
-) -> URLsSchema:
-    user = await user_service.get_user_by_id(token.user_id, session)
+    storage: Storage = Depends(get_storage),
+) -> Union[URLsSchema, StreamingResponse, Response]:
+    user = await user_service.get_principal(token.user_id, storage)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
-    urls = await url_service.get_urls(user, session)
+    after = decode_cursor(cursor) if cursor else None
+    # Read before the links, so a change made meanwhile yields a newer tag.
+    etag = await user_etag(request, user.id.hex)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    if format == "ndjson":
+
+        async def stream():
+            async for url in url_service.stream_urls(user.id, storage, after):
+                yield ndjson_line(url)
+
+        return StreamingResponse(
+            stream(), media_type="application/x-ndjson", headers=cache_headers(etag)
+        )
+    response.headers.update(cache_headers(etag))
+    urls, next_after = await url_service.get_urls(user, storage, limit, after)
     return URLsSchema(
         urls=[
             URLInfo(
                 id=url.id,
                 original_url=url.original_url,
-                short_url="http://localhost:8000/" + str(url.short_code),
+                short_url=short_url(url.short_code),
                 short_code=str(url.short_code),
                 visit_count=url.visit_count,
                 created_at=url.created_at,
                 expires_at=url.expires_at,
+                is_permanent=url.is_permanent,
+                analytics_enabled=url.analytics_enabled,
             )
             for url in urls
-        ]
+        ],
+        next=encode_cursor(next_after) if next_after else None,
     )
 
 
@@ -87,19 +238,19 @@ async def delete_url(
     url_service: URLServices = Depends(),
     user_service: UserService = Depends(),
     token: Optional[TokenPayload] = Depends(validate_token),
-    session: AsyncSession = Depends(get_async_session),
+    storage: Storage = Depends(get_storage),
 ) -> None:
     if token is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
         )
-    user = await user_service.get_user_by_id(token.user_id, session)
+    user = await user_service.get_principal(token.user_id, storage)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
     try:
-        await url_service.delete_url(short_code, user, session)
+        await url_service.delete_url(short_code, user, storage)
     except NOSuchURL as ext:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=ext.message)
     except IntegrityError:
@@ -119,26 +270,28 @@ async def update_url(
     url_service: URLServices = Depends(),
     user_service: UserService = Depends(),
     token: Optional[TokenPayload] = Depends(validate_token),
-    session: AsyncSession = Depends(get_async_session),
+    storage: Storage = Depends(get_storage),
 ) -> URLCreatedResponseSchema:
     if token is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
         )
-    user = await user_service.get_user_by_id(token.user_id, session)
+    user = await user_service.get_principal(token.user_id, storage)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
     try:
-        url = await url_service.update_url(short_code, url_data, user, session)
+        url = await url_service.update_url(short_code, url_data, user, storage)
         return URLCreatedResponseSchema(
             id=url.id,
             short_code=str(url.short_code),
             original_url=url.original_url,
-            short_url="http://localhost:8000/" + str(url.short_code),
+            short_url=short_url(url.short_code),
             created_at=url.created_at,
             expires_at=url.expires_at,
+            is_permanent=url.is_permanent,
+            analytics_enabled=url.analytics_enabled,
         )
     except NOSuchURL as ext:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=ext.message)
@@ -146,3 +299,60 @@ async def update_url(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Intern db error"
         )
+
+
+@url_router.get(
+    "/{short_code}/stats",
+    response_model=URLStatsSchema,
+    description="Visit counts per hour or day, served from pre-aggregated rollups",
+)
+async def get_url_stats(
+    short_code: str,
+    granularity: Literal["hour", "day"] = "hour",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    url_service: URLServices = Depends(),
+    user_service: UserService = Depends(),
+    token: Optional[TokenPayload] = Depends(validate_token),
+    storage: Storage = Depends(get_storage),
+) -> URLStatsSchema:
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
+        )
+    user = await user_service.get_principal(token.user_id, storage)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    end = end or datetime.now(timezone.utc)
+    start = start or end - DEFAULT_STATS_RANGE[granularity]
+    # Naive timestamps are taken to be UTC.
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    # Align the start with the bucket that contains it.
+    start = start.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        start = start.replace(hour=0)
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="'from' must be earlier than 'to'",
+        )
+    try:
+        buckets, unique_visitors = await url_service.get_stats(
+            short_code, granularity, start, end, user, storage
+        )
+    except NOSuchURL as ext:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=ext.message)
+    return URLStatsSchema(
+        short_code=short_code,
+        granularity=granularity,
+        start=start,
+        end=end,
+        total_visits=sum(visits for _, visits in buckets),
+        approx_unique_visitors=unique_visitors,
+        buckets=[StatsBucket(bucket=bucket, visits=visits) for bucket, visits in buckets],
+    )
@@ -1,5 +1,11 @@
-from API.db import User, get_async_session
-from API.exceptions import IntegrityError, UserAlreadyExists, WrongPassword
+from API.cache import profile_versions
+from API.db import User
+from API.exceptions import (
+    IntegrityError,
+    PasswordHasherBusy,
+    UserAlreadyExists,
+    WrongPassword,
+)
 from API.schemas import (
     TokenPayload,
     UserCreationSchema,
@@ -8,8 +14,10 @@ from API.schemas import (
     UserUpdateSchema,
 )
 from API.services import UserService, validate_token
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel.ext.asyncio.session import AsyncSession
+from API.storage import Storage, get_storage
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+
+from .conditional import cache_headers, not_modified, user_etag
 
 user_router = APIRouter()
 
@@ -23,10 +31,10 @@ user_router = APIRouter()
 async def create_user(
     user_data: UserCreationSchema,
     user_service: UserService = Depends(),
-    session: AsyncSession = Depends(get_async_session),
+    storage: Storage = Depends(get_storage),
 ) -> UserResponseSchema:
     try:
-        user = await user_service.create_user(user_data, session)
+        user = await user_service.create_user(user_data, storage)
         return UserResponseSchema(
             id=user.id,
             created_at=user.created_at,
@@ -38,6 +46,12 @@ async def create_user(
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail=f"{exp.email} {exp.message}"
         )
+    except PasswordHasherBusy as exp:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=exp.message,
+            headers={"Retry-After": "1"},
+        )
     except IntegrityError as exp:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Intern db error"
@@ -49,17 +63,27 @@ async def create_user(
     response_model=UserResponseSchema,
     status_code=status.HTTP_200_OK,
     summary="Get current user info",
+    description="Responses carry an ETag; send it back in If-None-Match to get "
+    "304 Not Modified while the profile is unchanged.",
 )
 async def get_current_user(
+    request: Request,
+    response: Response,
     user_service: UserService = Depends(),
     token: TokenPayload = Depends(validate_token),
-    session: AsyncSession = Depends(get_async_session),
-) -> UserResponseSchema:
+    storage: Storage = Depends(get_storage),
+) -> UserResponseSchema | Response:
     if token is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
         )
-    user: User | None = await user_service.get_user_by_id(token.user_id, session)
+    # Read before the profile, so a change made meanwhile yields a newer tag.
+    etag = await user_etag(request, token.user_id, profile_versions)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    response.headers.update(cache_headers(etag))
+    user = await user_service.get_principal(token.user_id, storage)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
@@ -83,19 +107,19 @@ async def update_current_user(
     user_data: UserUpdateSchema,
     user_service: UserService = Depends(),
     token: TokenPayload = Depends(validate_token),
-    session: AsyncSession = Depends(get_async_session),
+    storage: Storage = Depends(get_storage),
 ) -> UserResponseSchema:
     if token is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
         )
-    user: User | None = await user_service.get_user_by_id(token.user_id, session)
+    user: User | None = await user_service.get_user_by_id(token.user_id, storage)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
     try:
-        updated_user = await user_service.update_user(user, user_data, session)
+        updated_user = await user_service.update_user(user, user_data, storage)
         return UserResponseSchema(
             id=updated_user.id,
             created_at=updated_user.created_at,
@@ -105,6 +129,12 @@ async def update_current_user(
         )
     except WrongPassword as exp:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=exp.message)
+    except PasswordHasherBusy as exp:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=exp.message,
+            headers={"Retry-After": "1"},
+        )
     except IntegrityError as exp:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Intern db error"
@@ -120,21 +150,27 @@ async def delete_current_user(
     user_data: UserDeleteSchema,
     user_service: UserService = Depends(),
     token: TokenPayload = Depends(validate_token),
-    session: AsyncSession = Depends(get_async_session),
+    storage: Storage = Depends(get_storage),
 ) -> None:
     if token is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
         )
-    user: User | None = await user_service.get_user_by_id(token.user_id, session)
+    user: User | None = await user_service.get_user_by_id(token.user_id, storage)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
     try:
-        await user_service.delete_user(user_data, user, session)
+        await user_service.delete_user(user_data, user, storage)
     except WrongPassword as exp:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=exp.message)
+    except PasswordHasherBusy as exp:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=exp.message,
+            headers={"Retry-After": "1"},
+        )
     except IntegrityError as exp:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Intern db error"
@@ -1,9 +1,16 @@
+from .admin import HotLink, HotLinksSchema
 from .auth import TokenPayload, TokenResponse
 from .url import (
+    BulkItemError,
+    BulkURLCreatedItem,
+    BulkURLCreatedResponseSchema,
+    BulkURLCreationSchema,
+    StatsBucket,
     URLCreatedResponseSchema,
     URLCreationSchema,
     URLInfo,
     URLsSchema,
+    URLStatsSchema,
     URLUpdateSchema,
 )
 from .user import (
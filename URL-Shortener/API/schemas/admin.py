@@ -0,0 +1,22 @@
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class HotLink(BaseModel):
+    short_code: str = Field(..., description="Generated slug (e.g. aB78xZ)")
+    redirects: int = Field(
+        ...,
+        ge=0,
+        description="Redirects counted across replicas; a lower bound, since a "
+        "replica only counts a code exactly while it is among its hottest",
+    )
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class HotLinksSchema(BaseModel):
+    minutes: int = Field(..., description="Length of the window, ending now")
+    links: List[HotLink] = Field(..., description="Most redirected links, hottest first")
+
+    model_config = ConfigDict(extra="forbid")
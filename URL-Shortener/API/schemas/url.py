@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, ConfigDict, Field, HttpUrl, field_validator
@@ -10,6 +10,15 @@ class URLCreationSchema(BaseModel):
         ...,
         description="The URL to shorten (must start with http:// or https://)",
     )
+    is_permanent: bool = Field(
+        False,
+        description="Redirect with 308 Permanent Redirect instead of 307",
+    )
+    analytics_enabled: bool = Field(
+        True,
+        description="Record visits; when disabled a permanent link's redirect "
+        "may be cached by browsers and CDNs, so most clicks are not seen",
+    )
 
     # Forbid extra fields and allow population from attribute names
     model_config = ConfigDict(
@@ -23,6 +32,12 @@ class URLUpdateSchema(BaseModel):
         ...,
         description="Enter the new original URL (must start with http:// or https://)",
     )
+    is_permanent: Optional[bool] = Field(
+        None, description="Change the redirect status; omit to keep it"
+    )
+    analytics_enabled: Optional[bool] = Field(
+        None, description="Turn visit recording on or off; omit to keep it"
+    )
     model_config = ConfigDict(
         extra="forbid",
         populate_by_name=True,
@@ -38,6 +53,8 @@ class URLCreatedResponseSchema(BaseModel):
     expires_at: Optional[datetime] = Field(
         None, description="Expiration timestamp, if any"
     )
+    is_permanent: bool = Field(..., description="Redirects with 308 instead of 307")
+    analytics_enabled: bool = Field(..., description="Visits are recorded")
 
     model_config = ConfigDict(
         extra="forbid",
@@ -45,6 +62,34 @@ class URLCreatedResponseSchema(BaseModel):
     )
 
 
+class BulkURLCreationSchema(BaseModel):
+    # Items are validated one by one so that a bad item does not reject the
+    # whole batch.
+    items: List[Dict[str, Any]] = Field(
+        ..., min_length=1, description="URLCreationSchema objects to shorten"
+    )
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class BulkURLCreatedItem(URLCreatedResponseSchema):
+    index: int = Field(..., description="Position of the item in the request")
+
+
+class BulkItemError(BaseModel):
+    index: int = Field(..., description="Position of the item in the request")
+    detail: str = Field(..., description="Why the item was rejected")
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class BulkURLCreatedResponseSchema(BaseModel):
+    created: List[BulkURLCreatedItem] = Field(..., description="Shortened URLs")
+    errors: List[BulkItemError] = Field(..., description="Rejected items")
+
+    model_config = ConfigDict(extra="forbid")
+
+
 class URLInfo(BaseModel):
     id: UUID = Field(..., description="Short URL entry ID")
     short_url: str = Field(..., description="Full shortened URL")
@@ -59,11 +104,42 @@ class URLInfo(BaseModel):
     expires_at: Optional[datetime] = Field(
         None, description="Expiration timestamp, if set"
     )
+    is_permanent: bool = Field(..., description="Redirects with 308 instead of 307")
+    analytics_enabled: bool = Field(..., description="Visits are recorded")
 
     model_config = ConfigDict(extra="forbid")
 
 
 class URLsSchema(BaseModel):
     urls: List[URLInfo] = Field(..., description="List of shortened URLs")
+    next: Optional[str] = Field(
+        None, description="Cursor for the next page, absent on the last page"
+    )
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class StatsBucket(BaseModel):
+    bucket: datetime = Field(..., description="Start of the bucket (UTC)")
+    visits: int = Field(..., ge=0, description="Number of visits in the bucket")
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class URLStatsSchema(BaseModel):
+    short_code: str = Field(..., description="Generated slug (e.g. aB78xZ)")
+    granularity: Literal["hour", "day"] = Field(..., description="Bucket size")
+    start: datetime = Field(..., description="Inclusive start of the range")
+    end: datetime = Field(..., description="Exclusive end of the range")
+    total_visits: int = Field(..., ge=0, description="Visits within the range")
+    approx_unique_visitors: int = Field(
+        ...,
+        ge=0,
+        description="HyperLogLog estimate of distinct (IP address, user agent) "
+        "pairs over the UTC days overlapping the range; standard error about 1.6%",
+    )
+    buckets: List[StatsBucket] = Field(
+        ..., description="Buckets with at least one visit, oldest first"
+    )
 
     model_config = ConfigDict(extra="forbid")
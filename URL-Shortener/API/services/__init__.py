@@ -2,8 +2,16 @@ from .auth import (
     create_access_token,
     get_password_hash,
     validate_token,
+    verify_and_update_password,
     verify_password,
 )
-from .main import MainService
+from .codes import (
+    CodeAllocator,
+    FeistelScrambler,
+    NanoidAllocator,
+    SequenceAllocator,
+    code_allocator,
+)
+from .main import MainService, redirect_policy
 from .url import URLServices
 from .user import UserService
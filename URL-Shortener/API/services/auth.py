@@ -1,8 +1,12 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
 
 import jwt
+from API.cache import principal_cache
 from API.config import settings
+from API.exceptions import PasswordHasherBusy
 from API.schemas import TokenPayload
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
@@ -12,18 +16,86 @@ OAUTH2_SCHEME = OAuth2PasswordBearer(
     tokenUrl="/api/v1/auth/token", refreshUrl="/api/v1/auth/refresh", auto_error=False
 )
 
-PWD_CONTEXT = CryptContext(
-    schemes=["bcrypt"],
-    deprecated="auto",
+
+def create_crypt_context() -> CryptContext:
+    """
+    Hashes use PASSWORD_HASH_SCHEME with the configured cost; hashes made with
+    another scheme or cost are reported as needing an update.
+    """
+    options = {
+        "bcrypt__default_rounds": settings.BCRYPT_ROUNDS,
+        "bcrypt__min_rounds": settings.BCRYPT_ROUNDS,
+        "bcrypt__max_rounds": settings.BCRYPT_ROUNDS,
+    }
+    schemes = ["bcrypt"]
+    if settings.PASSWORD_HASH_SCHEME == "argon2":
+        schemes.insert(0, "argon2")
+        options.update(
+            {
+                "argon2__default_rounds": settings.ARGON2_TIME_COST,
+                "argon2__min_rounds": settings.ARGON2_TIME_COST,
+                "argon2__max_rounds": settings.ARGON2_TIME_COST,
+                "argon2__memory_cost": settings.ARGON2_MEMORY_COST,
+                "argon2__parallelism": settings.ARGON2_PARALLELISM,
+            }
+        )
+    return CryptContext(schemes=schemes, deprecated="auto", **options)
+
+
+PWD_CONTEXT = create_crypt_context()
+
+
+class PasswordHasher:
+    """Runs password hashing on a dedicated, bounded thread pool.
+
+    bcrypt and Argon2 release the GIL, so hashing in threads keeps the event
+    loop free. At most ``max_pending`` operations may be queued or running;
+    beyond that :class:`PasswordHasherBusy` is raised immediately.
+    """
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash"
+        )
+
+    async def run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+
+PASSWORD_HASHER = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
 )
 
 
-def verify_password(plain_password, hashed_password):
-    return PWD_CONTEXT.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password) -> bool:
+    return await PASSWORD_HASHER.run(
+        PWD_CONTEXT.verify, plain_password, hashed_password
+    )
+
+
+async def verify_and_update_password(
+    plain_password, hashed_password
+) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also returns a new hash when the stored one is outdated."""
+    return await PASSWORD_HASHER.run(
+        PWD_CONTEXT.verify_and_update, plain_password, hashed_password
+    )
 
 
-def get_password_hash(password):
-    return PWD_CONTEXT.hash(password)
+async def get_password_hash(password) -> str:
+    return await PASSWORD_HASHER.run(PWD_CONTEXT.hash, password)
 
 
 def create_access_token(data: dict) -> str:
@@ -50,6 +122,10 @@ async def validate_token(
     if not token:
         return None
 
+    digest = principal_cache.digest(token)
+    cached = principal_cache.get_token(digest)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(
             token,
@@ -57,7 +133,9 @@ async def validate_token(
             algorithms=[settings.ALGORITHM],
             options={"verify_exp": True},
         )
-        return TokenPayload.model_validate(payload)
+        payload = TokenPayload.model_validate(payload)
+        principal_cache.set_token(digest, payload)
+        return payload
 
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
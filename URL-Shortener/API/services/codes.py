@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from API.config import settings
+from API.storage import Storage
+from nanoid import generate
+
+
+class CodeAllocator(ABC):
+    """Hands out short codes for new links."""
+
+    # Whether two allocations can return the same code, in which case the
+    # caller has to retry on a unique violation.
+    may_collide: bool = False
+
+    async def allocate(self, storage: Storage) -> str:
+        return (await self.allocate_many(1, storage))[0]
+
+    @abstractmethod
+    async def allocate_many(self, count: int, storage: Storage) -> List[str]:
+        raise NotImplementedError
+
+
+class NanoidAllocator(CodeAllocator):
+    """Random codes drawn from ``alphabet``."""
+
+    may_collide = True
+
+    def __init__(self, alphabet: str, length: int) -> None:
+        self.alphabet = alphabet
+        self.length = length
+
+    async def allocate_many(self, count: int, storage: Storage) -> List[str]:
+        return [generate(self.alphabet, self.length) for _ in range(count)]
+
+
+class FeistelScrambler:
+    """Keyed bijection on ``[0, domain)``.
+
+    A balanced Feistel network permutes the smallest even-width bit space
+    holding ``domain``; cycle walking maps the result back into the domain.
+    Consecutive inputs produce unrelated-looking outputs, which keeps
+    sequential codes from being enumerable. It is not a cryptographic
+    guarantee.
+    """
+
+    def __init__(self, domain: int, key: bytes, rounds: int = 4) -> None:
+        self.domain = domain
+        bits = max(2, (domain - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.mask = (1 << self.half_bits) - 1
+        self.keys = [
+            hashlib.blake2b(key, digest_size=16, person=b"code-round%d" % i).digest()
+            for i in range(rounds)
+        ]
+
+    def _round(self, value: int, key: bytes) -> int:
+        digest = hashlib.blake2b(value.to_bytes(8, "big"), key=key, digest_size=8)
+        return int.from_bytes(digest.digest(), "big") & self.mask
+
+    def _permute(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half_bits) | right
+
+    def scramble(self, value: int) -> int:
+        value = self._permute(value)
+        while value >= self.domain:
+            value = self._permute(value)
+        return value
+
+
+class SequenceAllocator(CodeAllocator):
+    """Codes encoded from a shared sequence (``shorturl_code_seq`` in Postgres).
+
+    Each process leases a block of ids with a single ``nextval`` and hands
+    them out locally without further coordination. The block size is the one
+    reported by the storage (the sequence's stored increment in Postgres), so
+    processes configured with different ``block_size`` values can never hand
+    out overlapping ids. Codes
+    are fixed-length base-``len(alphabet)`` numbers, optionally scrambled so
+    they are not guessable.
+    """
+
+    def __init__(
+        self,
+        alphabet: str,
+        length: int,
+        block_size: int,
+        scrambler: Optional[FeistelScrambler] = None,
+    ) -> None:
+        self.alphabet = alphabet
+        self.length = length
+        self.block_size = block_size
+        self._block_size_checked = False
+        self.domain = len(alphabet) ** length
+        self.scrambler = scrambler
+        self._next = 0
+        self._end = 0
+        self._blocks: List[int] = []
+        self._lock = asyncio.Lock()
+
+    async def _lease_blocks(self, count: int, storage: Storage) -> List[int]:
+        """Reserve ``count`` blocks; returns the first id of each."""
+        return await storage.lease_code_blocks(count)
+
+    async def _refill(self, ids_needed: int, storage: Storage) -> None:
+        if not self._block_size_checked:
+            self.block_size = await storage.code_block_size()
+            self._block_size_checked = True
+        blocks = -(-ids_needed // self.block_size)
+        self._blocks.extend(await self._lease_blocks(blocks, storage))
+
+    def encode(self, value: int) -> str:
+        if value >= self.domain:
+            raise OverflowError("Short code space exhausted; increase the code length")
+        if self.scrambler is not None:
+            value = self.scrambler.scramble(value)
+        base = len(self.alphabet)
+        chars = []
+        for _ in range(self.length):
+            value, digit = divmod(value, base)
+            chars.append(self.alphabet[digit])
+        return "".join(reversed(chars))
+
+    async def allocate_many(self, count: int, storage: Storage) -> List[str]:
+        async with self._lock:
+            ids: List[int] = []
+            while len(ids) < count:
+                if self._next >= self._end:
+                    if not self._blocks:
+                        await self._refill(count - len(ids), storage)
+                    self._next = self._blocks.pop(0)
+                    self._end = self._next + self.block_size
+                take = min(count - len(ids), self._end - self._next)
+                ids.extend(range(self._next, self._next + take))
+                self._next += take
+        return [self.encode(value) for value in ids]
+
+
+def create_code_allocator() -> CodeAllocator:
+    if settings.SHORT_CODE_ALLOCATOR == "sequence":
+        domain = len(settings.NANO_CODE_STRING) ** settings.SHORT_CODE_LENGTH
+        return SequenceAllocator(
+            alphabet=settings.NANO_CODE_STRING,
+            length=settings.SHORT_CODE_LENGTH,
+            block_size=settings.SHORT_CODE_BLOCK_SIZE,
+            scrambler=(
+                FeistelScrambler(domain, settings.SECRET_KEY.encode())
+                if settings.SHORT_CODE_SCRAMBLE
+                else None
+            ),
+        )
+    return NanoidAllocator(settings.NANO_CODE_STRING, settings.SHORT_CODE_LENGTH)
+
+
+code_allocator = create_code_allocator()
@@ -1,18 +1,114 @@
-from API.db import ShortURL
-from API.celery import prepare_report
-from sqlmodel import select
-from sqlmodel.ext.asyncio.session import AsyncSession
+import time
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from API.cache import (
+    NOT_FOUND,
+    CachedRedirect,
+    hot_codes,
+    redirect_cache,
+    shared_redirect_cache,
+)
+from API.celery import visit_buffer
+from API.config import settings
+from API.exceptions import URLExpired
+from API.metrics import REDIRECTS, VISIT_ENQUEUE_DURATION
+from API.storage import Storage
+
+
+def redirect_policy(
+    redirect: CachedRedirect, now: Optional[datetime] = None
+) -> Tuple[int, Optional[str]]:
+    """Status code and Cache-Control header (if any) of a redirect response.
+
+    Permanent links answer 308. Without analytics they may be cached by
+    browsers and CDNs for up to REDIRECT_MAX_AGE seconds, never past the
+    link's expiry; with analytics every click has to reach us, and as a 308
+    is cacheable by default that is spelled out with ``no-store``. Other
+    links answer 307, which is not cached unless told to.
+    """
+    if not redirect.is_permanent:
+        return 307, None
+    if redirect.analytics_enabled:
+        return 308, "no-store"
+    max_age = settings.REDIRECT_MAX_AGE
+    if redirect.expires_at is not None:
+        now = now or datetime.now(timezone.utc)
+        max_age = min(max_age, int((redirect.expires_at - now).total_seconds()))
+    return 308, f"public, max-age={max(max_age, 0)}"
 
 
 class MainService:
     def __init__(self):
         pass
 
-    async def redirect(self, code: str,user_data:dict, session: AsyncSession):
-        url = await session.exec(select(ShortURL).where(ShortURL.short_code == code))
-        url = url.first()
-        if url is None:
-            return None
-        user_data.update({"short_url_id": url.id.hex})
-        prepare_report.delay(user_data)
-        return url.original_url
+    async def redirect(
+        self, code: str, user_data: dict, storage: Storage
+    ) -> Optional[CachedRedirect]:
+        """The link behind ``code``, or None if there is none. Raises
+        ``URLExpired`` for expired links; visits are recorded only for links
+        with analytics enabled."""
+        cached = redirect_cache.get(code)
+        outcome = "local_hit"
+        if cached is None:
+            outcome = "shared_hit"
+            shared, generation = await shared_redirect_cache.get(code)
+            if shared is NOT_FOUND:
+                REDIRECTS.inc(("not_found",))
+                return None
+            fresh = True
+            if shared is None:
+                outcome = "db_hit"
+                url = await storage.get_redirect(code)
+                if url is None:
+                    await shared_redirect_cache.set_missing(code, generation)
+                    REDIRECTS.inc(("not_found",))
+                    return None
+                id, *redirect = url
+                shared = (id.hex, *redirect)
+                fresh = await shared_redirect_cache.set(code, generation, *shared)
+            # Counted before caching so admission sees this request too.
+            hot_codes.record(code)
+            if fresh:
+                cached = redirect_cache.set(code, *shared)
+            else:
+                # Changed while it was read: answer with it, but cache nothing.
+                cached = CachedRedirect(*shared, stale_at=0.0)
+        else:
+            hot_codes.record(code)
+        now = datetime.now(timezone.utc)
+        if cached.expires_at is not None and cached.expires_at <= now:
+            REDIRECTS.inc(("expired",))
+            raise URLExpired()
+        REDIRECTS.inc((outcome,))
+        if cached.analytics_enabled:
+            user_data.update(
+                {"short_url_id": cached.short_url_id, "visited_at": now.isoformat()}
+            )
+            start = time.perf_counter()
+            await visit_buffer.put(user_data)
+            VISIT_ENQUEUE_DURATION.observe(time.perf_counter() - start)
+        return cached
+
+    async def prewarm(self, storage: Storage, limit: int, minutes: int = 60) -> int:
+        """Load the ``limit`` codes most redirected across all replicas in the
+        last ``minutes`` into the in-process cache; returns how many were loaded."""
+        loaded = 0
+        for code, count in await hot_codes.top(minutes, limit):
+            # Hot codes start with their share of the admission sketch, so a
+            # burst of new codes right after startup cannot displace them.
+            hot_codes.seed(code, count)
+            shared, generation = await shared_redirect_cache.get(code)
+            if shared is NOT_FOUND:
+                continue
+            if shared is None:
+                url = await storage.get_redirect(code)
+                if url is None:
+                    continue
+                id, *redirect = url
+                shared = (id.hex, *redirect)
+                if not await shared_redirect_cache.set(code, generation, *shared):
+                    continue
+            redirect_cache.set(code, *shared)
+            loaded += 1
+        return loaded
@@ -1,14 +1,15 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import AsyncIterator, List, Optional, Tuple
+from uuid import UUID
 
+from API.cache import Principal, shared_redirect_cache, user_versions
 from API.config import settings
-from API.db import ShortURL, User
-from API.exceptions import IntegrityError, NOSuchURL
+from API.db import ShortURL
+from API.exceptions import IntegrityError, NOSuchURL, ShortCodeTaken
+from API.hll import merge_sketches
 from API.schemas import URLCreationSchema, URLUpdateSchema
-from nanoid import generate
-from sqlalchemy.exc import IntegrityError as alchemy_IntegrityError
-from sqlmodel import select
-from sqlmodel.ext.asyncio.session import AsyncSession
+from API.services.codes import code_allocator
+from API.storage import Storage
 
 
 class URLServices:
@@ -16,66 +17,163 @@ class URLServices:
         pass
 
     async def create_url(
-        self, url_data: URLCreationSchema, user: Optional[User], session: AsyncSession
+        self, url_data: URLCreationSchema, user: Optional[Principal], storage: Storage
     ) -> ShortURL:
-        url: ShortURL = ShortURL(
-            id=None,  # type:ignore
-            created_at=None,  # type:ignore
-            visit_count=None,  # type:ignore
-            short_code=generate(settings.NANO_CODE_STRING, 12),
-            original_url=str(url_data.original_url),
-            user_id=None if user is None else user.id,
-            expires_at=datetime.now(timezone.utc)
-            + timedelta(days=settings.URL_EXPIRE_DAYS),
+        for _ in range(settings.SHORT_CODE_MAX_RETRIES + 1):
+            url: ShortURL = ShortURL(
+                id=None,  # type:ignore
+                created_at=None,  # type:ignore
+                visit_count=None,  # type:ignore
+                short_code=await code_allocator.allocate(storage),
+                original_url=str(url_data.original_url),
+                user_id=None if user is None else user.id,
+                expires_at=datetime.now(timezone.utc)
+                + timedelta(days=settings.URL_EXPIRE_DAYS),
+                is_permanent=url_data.is_permanent,
+                analytics_enabled=url_data.analytics_enabled,
+            )
+            storage.add_url(url)
+            try:
+                await storage.commit()
+                if user is not None:
+                    await user_versions.bump(user.id.hex)
+                return url
+            except ShortCodeTaken:
+                if not code_allocator.may_collide:
+                    raise IntegrityError
+        raise IntegrityError
+
+    async def create_urls(
+        self,
+        urls_data: List[URLCreationSchema],
+        user: Optional[Principal],
+        storage: Storage,
+    ) -> List[Tuple[int, ShortURL]]:
+        """
+        Shorten many URLs in a single transaction; codes that turn out to be
+        taken are re-drawn. Returns ``(position in urls_data, url)`` pairs.
+        """
+        user_id = None if user is None else user.id
+        expires_at = datetime.now(timezone.utc) + timedelta(
+            days=settings.URL_EXPIRE_DAYS
         )
-        session.add(url)
+        created: List[Tuple[int, ShortURL]] = []
+        pending = list(range(len(urls_data)))
+        for _ in range(settings.SHORT_CODE_MAX_RETRIES + 1):
+            codes = await code_allocator.allocate_many(len(pending), storage)
+            by_code: dict = {}
+            # Items whose code was drawn twice in this round get another draw.
+            redraw = pending[len(codes) :]
+            for code, index in zip(codes, pending):
+                if code in by_code:
+                    redraw.append(index)
+                else:
+                    by_code[code] = index
+            inserted = await storage.add_urls(
+                [
+                    ShortURL(
+                        short_code=code,
+                        original_url=str(urls_data[index].original_url),
+                        user_id=user_id,
+                        expires_at=expires_at,
+                        is_permanent=urls_data[index].is_permanent,
+                        analytics_enabled=urls_data[index].analytics_enabled,
+                    )
+                    for code, index in by_code.items()
+                ]
+            )
+            for url in inserted:
+                created.append((by_code.pop(url.short_code), url))
+            # Whatever is left collided with an existing code.
+            pending = sorted([*by_code.values(), *redraw])
+            if not pending:
+                break
+        if pending:
+            await storage.rollback()
+            raise IntegrityError
         try:
-            await session.commit()
-            await session.refresh(url)
-            return url
-        except alchemy_IntegrityError:
+            await storage.commit()
+        except ShortCodeTaken:
             raise IntegrityError
+        if user_id is not None:
+            await user_versions.bump(user_id.hex)
+        return sorted(created, key=lambda item: item[0])
 
-    async def get_urls(self, user: User, session: AsyncSession):
-        urls = await session.exec(select(ShortURL).where(ShortURL.user_id == user.id))
-        return urls
+    async def get_urls(
+        self,
+        user: Principal,
+        storage: Storage,
+        limit: int = 100,
+        after: Optional[UUID] = None,
+    ) -> Tuple[list, Optional[UUID]]:
+        """
+        One page of the user's links, newest first.
+        Returns the page and the id to continue after (None on the last page).
+        """
+        urls = await storage.list_urls(user.id, limit + 1, after)
+        if len(urls) > limit:
+            return urls[:limit], urls[limit - 1].id
+        return urls, None
 
-    async def delete_url(self, short_code: str, user: User, session: AsyncSession):
-        url = await session.exec(
-            select(ShortURL).where(ShortURL.short_code == short_code)
-        )
-        url = url.first()
+    def stream_urls(
+        self, user_id: UUID, storage: Storage, after: Optional[UUID] = None
+    ) -> AsyncIterator:
+        """All of the user's links, newest first, readable after the request ends."""
+        return storage.stream_urls(user_id, after)
+
+    async def delete_url(self, short_code: str, user: Principal, storage: Storage):
+        url = await storage.get_url(short_code)
         if url is None:
             # print("No such url")
             raise NOSuchURL()
         if url.user_id != user.id:
             raise NOSuchURL("You are not the owner of the url")
-        try:
-            await session.delete(url)
-            await session.commit()
-        except alchemy_IntegrityError:
-            raise IntegrityError
+        await storage.delete_url(url)
+        await storage.commit()
+        await shared_redirect_cache.invalidate(short_code)
+        await user_versions.bump(user.id.hex)
 
     async def update_url(
         self,
         short_code: str,
         url_data: URLUpdateSchema,
-        user: User,
-        session: AsyncSession,
+        user: Principal,
+        storage: Storage,
     ) -> ShortURL:
-        url = await session.exec(
-            select(ShortURL).where(ShortURL.short_code == short_code)
-        )
-        url = url.first()
+        url = await storage.get_url(short_code)
         if url is None:
             # print("No such url")
             raise NOSuchURL()
         if url.user_id != user.id:
             raise NOSuchURL("You are not the owner of the url")
         url.original_url = str(url_data.original_url)
-        try:
-            await session.commit()
-            await session.refresh(url)
-            return url
-        except alchemy_IntegrityError:
-            raise IntegrityError
+        if url_data.is_permanent is not None:
+            url.is_permanent = url_data.is_permanent
+        if url_data.analytics_enabled is not None:
+            url.analytics_enabled = url_data.analytics_enabled
+        storage.update_url(url)
+        await storage.commit()
+        await shared_redirect_cache.invalidate(short_code)
+        await user_versions.bump(user.id.hex)
+        return url
+
+    async def get_stats(
+        self,
+        short_code: str,
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        user: Principal,
+        storage: Storage,
+    ) -> Tuple[List[Tuple[datetime, int]], int]:
+        """Visit counts per bucket in ``[start, end)`` and the approximate number
+        of distinct visitors, read from the rollups only."""
+        url = await storage.get_url_owner(short_code)
+        if url is None:
+            raise NOSuchURL()
+        id, user_id = url
+        if user_id != user.id:
+            raise NOSuchURL("You are not the owner of the url")
+        buckets = await storage.get_visit_buckets(id, granularity, start, end)
+        sketches = await storage.get_visitor_sketches(id, start, end)
+        return buckets, merge_sketches(sketches).count()
@@ -1,78 +1,92 @@
+from API.cache import (
+    Principal,
+    principal_cache,
+    profile_versions,
+    publish_invalidation,
+)
 from API.db import User
 from API.exceptions import (
     EmailAlreadyRegistered,
-    IntegrityError,
     UserAlreadyExists,
     WrongPassword,
 )
 from API.schemas import UserCreationSchema, UserDeleteSchema, UserUpdateSchema
 from API.services import get_password_hash, verify_password
-from sqlalchemy.exc import IntegrityError as alchemy_IntegrityError
-from sqlmodel import select
-from sqlmodel.ext.asyncio.session import AsyncSession
+from API.storage import Storage
 
 
 class UserService:
     def __init__(self) -> None:
         pass
 
-    async def get_user_by_email(self, email: str, session: AsyncSession) -> User | None:
-        user = await session.exec(select(User).where(User.email == email.lower()))
-        return user.first()
+    async def get_user_by_email(self, email: str, storage: Storage) -> User | None:
+        return await storage.get_user_by_email(email)
 
-    async def get_user_by_id(self, id: str, session: AsyncSession) -> User | None:
-        user = await session.exec(select(User).where(User.id == id))
-        return user.first()
+    async def get_user_by_id(self, id: str, storage: Storage) -> User | None:
+        storage.act_for(id)
+        return await storage.get_user_by_id(id)
 
-    async def create_user(
-        self, user_data: UserCreationSchema, session: AsyncSession
-    ) -> User:
-        existing_user = await self.get_user_by_email(user_data.email, session)
+    async def update_password_hash(
+        self, user: User, hashed_password: str, storage: Storage
+    ) -> None:
+        """Store a re-computed hash of the user's unchanged password."""
+        user.hashed_password = hashed_password
+        storage.update_user(user)
+        await storage.commit()
+
+    async def get_principal(self, id: str, storage: Storage) -> Principal | None:
+        """Slim user record for an authenticated request, cached between requests."""
+        storage.act_for(id)
+        principal = principal_cache.get_user(id)
+        if principal is not None:
+            return principal
+        principal = await storage.get_principal(id)
+        if principal is None:
+            return None
+        principal_cache.set_user(principal)
+        return principal
+
+    async def create_user(self, user_data: UserCreationSchema, storage: Storage) -> User:
+        existing_user = await self.get_user_by_email(user_data.email, storage)
         if existing_user:
             raise EmailAlreadyRegistered(email=user_data.email)
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await get_password_hash(user_data.password)
         user = User(
             username=user_data.username,
             email=user_data.email,
             hashed_password=hashed_password,
         )  # type: ignore
-        session.add(user)
-        try:
-            await session.commit()
-            await session.refresh(user)
-            return user
-        except alchemy_IntegrityError:
-            raise IntegrityError
+        storage.add_user(user)
+        await storage.commit()
+        return user
 
     async def update_user(
-        self, user: User, user_data: UserUpdateSchema, session: AsyncSession
+        self, user: User, user_data: UserUpdateSchema, storage: Storage
     ) -> User:
         if user_data.username:
             user.username = user_data.username
         if user_data.email:
             user.email = user_data.email
         if user_data.new_password:
-            if user_data.previous_password is None or not verify_password(
+            if user_data.previous_password is None or not await verify_password(
                 user_data.previous_password, user.hashed_password
             ):
                 raise WrongPassword(
                     message="Provide current password for password update."
                 )
-            user.hashed_password = get_password_hash(user_data.new_password)
-        try:
-            await session.commit()
-            await session.refresh(user)
-            return user
-        except alchemy_IntegrityError:
-            raise IntegrityError
+            user.hashed_password = await get_password_hash(user_data.new_password)
+        storage.update_user(user)
+        await storage.commit()
+        await publish_invalidation("principal", [user.id.hex])
+        await profile_versions.bump(user.id.hex)
+        return user
 
     async def delete_user(
-        self, user_data: UserDeleteSchema, user: User, session: AsyncSession
+        self, user_data: UserDeleteSchema, user: User, storage: Storage
     ) -> None:
-        if not verify_password(user_data.password, user.hashed_password):
+        if not await verify_password(user_data.password, user.hashed_password):
             raise WrongPassword(message="Provide correct password for user deletion.")
-        try:
-            await session.delete(user)
-            await session.commit()
-        except alchemy_IntegrityError:
-            raise IntegrityError
+        await storage.delete_user(user)
+        await storage.commit()
+        await publish_invalidation("principal", [user.id.hex])
+        await profile_versions.bump(user.id.hex)
@@ -0,0 +1,4 @@
+from .base import Storage
+from .dependency import get_storage, memory_database
+from .memory import InMemoryStorage, MemoryDatabase
+from .sql import SQLStorage
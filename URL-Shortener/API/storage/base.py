@@ -0,0 +1,138 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from API.cache import Principal
+from API.db import ShortURL, User
+
+
+class Storage(ABC):
+    """Persistence used by the services, scoped to one request.
+
+    Writes are staged until :meth:`commit`, which applies them atomically and
+    fills in server-generated values (ids, timestamps) on the staged objects.
+    A failed commit leaves nothing applied and raises ``ShortCodeTaken`` when
+    a short code is already in use or ``IntegrityError`` for any other
+    constraint (duplicate email, deleting a user who still owns links).
+    Emails are stored lowercased, so uniqueness and lookups by email ignore
+    case.
+    Changed objects must be passed to the matching ``update_*`` method; some
+    implementations hand out snapshots that are not tracked otherwise.
+    """
+
+    def act_for(self, user_id: str) -> None:
+        """Note the user the request acts for, so reads can observe their writes."""
+
+    async def close(self) -> None:
+        """Release connections; called once the request is finished."""
+
+    # --- Transactions ---
+    @abstractmethod
+    async def commit(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def rollback(self) -> None:
+        raise NotImplementedError
+
+    # --- Short URLs ---
+    @abstractmethod
+    async def get_redirect(
+        self, short_code: str
+    ) -> Optional[Tuple[UUID, str, Optional[datetime], bool, bool]]:
+        """``(id, original_url, expires_at, is_permanent, analytics_enabled)``
+        of the link, expired or not."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_url(self, short_code: str) -> Optional[ShortURL]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_url_owner(
+        self, short_code: str
+    ) -> Optional[Tuple[UUID, Optional[UUID]]]:
+        """``(id, user_id)`` of the link."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_urls(
+        self, user_id: UUID, limit: int, after: Optional[UUID] = None
+    ) -> Sequence:
+        """Up to ``limit`` of the user's links with ids below ``after``, newest first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def stream_urls(
+        self, user_id: UUID, after: Optional[UUID] = None
+    ) -> AsyncIterator:
+        """All of the user's links, newest first. Usable after the request ends."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_url(self, url: ShortURL) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_urls(self, urls: List[ShortURL]) -> List[ShortURL]:
+        """Stage ``urls``, skipping those whose short code is taken; returns the rest."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_url(self, url: ShortURL) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_url(self, url: ShortURL) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_visit_buckets(
+        self, short_url_id: UUID, granularity: str, start: datetime, end: datetime
+    ) -> List[Tuple[datetime, int]]:
+        """Visit counts per hour or day bucket in ``[start, end)``, oldest first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_visitor_sketches(
+        self, short_url_id: UUID, start: datetime, end: datetime
+    ) -> List[bytes]:
+        """Distinct visitor sketches of the UTC days overlapping ``[start, end)``."""
+        raise NotImplementedError
+
+    # --- Short code sequence ---
+    @abstractmethod
+    async def code_block_size(self) -> int:
+        """Ids reserved by each :meth:`lease_code_blocks` block."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def lease_code_blocks(self, count: int) -> List[int]:
+        """Reserve ``count`` blocks of ids; returns the first id of each."""
+        raise NotImplementedError
+
+    # --- Users ---
+    @abstractmethod
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_user_by_id(self, id: str) -> Optional[User]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_principal(self, id: str) -> Optional[Principal]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_user(self, user: User) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_user(self, user: User) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_user(self, user: User) -> None:
+        raise NotImplementedError
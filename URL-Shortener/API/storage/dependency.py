@@ -0,0 +1,23 @@
+from typing import Any, AsyncGenerator
+
+from API.config import settings
+from API.db import async_session_maker, replica_router
+
+from .base import Storage
+from .memory import InMemoryStorage, MemoryDatabase
+from .sql import SQLStorage
+
+memory_database = MemoryDatabase(code_block_size=settings.SHORT_CODE_BLOCK_SIZE)
+
+
+async def get_storage() -> AsyncGenerator[Storage, Any]:
+    """Dependency function that yields the configured storage for one request."""
+    if settings.STORAGE_BACKEND == "memory":
+        yield InMemoryStorage(memory_database)
+        return
+    async with async_session_maker() as session:
+        storage = SQLStorage(session, replica_router)
+        try:
+            yield storage
+        finally:
+            await storage.close()
@@ -0,0 +1,313 @@
+import random
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from API.cache import Principal
+from API.db import ShortURL, User
+from API.exceptions import IntegrityError, ShortCodeTaken
+
+from .base import Storage
+
+
+def _copy(obj):
+    return type(obj)(**obj.model_dump())
+
+
+def _parse_id(id: str) -> Optional[UUID]:
+    try:
+        return UUID(str(id))
+    except ValueError:
+        return None
+
+
+class MemoryDatabase:
+    """Process-local tables shared by every :class:`InMemoryStorage`.
+
+    Enforces the same constraints as the Postgres schema: unique short codes
+    and emails, link owners must exist and users who own links cannot be
+    deleted. Ids are time-ordered like ``uuidv7()`` so listings page the same
+    way. Visits are recorded by the worker, which is not involved here, so
+    visit counts and rollups stay empty.
+    """
+
+    def __init__(self, code_block_size: int) -> None:
+        self.users: Dict[UUID, User] = {}
+        self.user_emails: Dict[str, UUID] = {}
+        self.urls: Dict[UUID, ShortURL] = {}
+        self.url_codes: Dict[str, UUID] = {}
+        # Ids of each user's links, ascending.
+        self.user_urls: Dict[UUID, List[UUID]] = {}
+        self.code_block_size = code_block_size
+        self.next_code_id = 1
+        self._last_id = 0
+
+    def new_id(self) -> UUID:
+        """Version 7 UUID, strictly increasing within the process."""
+        value = (
+            (time.time_ns() // 1_000_000) << 80
+            | 0x7 << 76
+            | random.getrandbits(12) << 64
+            | 0b10 << 62
+            | random.getrandbits(62)
+        )
+        if value <= self._last_id:
+            value = self._last_id + 1
+        self._last_id = value
+        return UUID(int=value)
+
+    def clear(self) -> None:
+        self.users.clear()
+        self.user_emails.clear()
+        self.urls.clear()
+        self.url_codes.clear()
+        self.user_urls.clear()
+
+    # Each write applies one change and appends the callable reverting it.
+
+    def insert_url(self, url: ShortURL, undo: List[Callable]) -> None:
+        if url.short_code in self.url_codes:
+            raise ShortCodeTaken()
+        if url.user_id is not None and url.user_id not in self.users:
+            raise IntegrityError
+        self._store_url(_copy(url))
+        undo.append(lambda: self._remove_url(url.id))
+
+    def replace_url(self, url: ShortURL, undo: List[Callable]) -> None:
+        previous = self.urls.get(url.id)
+        if previous is None:
+            raise IntegrityError
+        if url.short_code != previous.short_code and url.short_code in self.url_codes:
+            raise ShortCodeTaken()
+        self._remove_url(url.id)
+        self._store_url(_copy(url))
+
+        def restore() -> None:
+            self._remove_url(url.id)
+            self._store_url(previous)
+
+        undo.append(restore)
+
+    def remove_url(self, url: ShortURL, undo: List[Callable]) -> None:
+        previous = self.urls.get(url.id)
+        if previous is None:
+            return
+        self._remove_url(url.id)
+        undo.append(lambda: self._store_url(previous))
+
+    def _store_url(self, url: ShortURL) -> None:
+        self.urls[url.id] = url
+        self.url_codes[url.short_code] = url.id
+        if url.user_id is not None:
+            insort(self.user_urls.setdefault(url.user_id, []), url.id)
+
+    def _remove_url(self, id: UUID) -> None:
+        url = self.urls.pop(id)
+        del self.url_codes[url.short_code]
+        if url.user_id is not None:
+            ids = self.user_urls[url.user_id]
+            del ids[bisect_left(ids, id)]
+            if not ids:
+                del self.user_urls[url.user_id]
+
+    def insert_user(self, user: User, undo: List[Callable]) -> None:
+        if user.email in self.user_emails:
+            raise IntegrityError
+        self._store_user(_copy(user))
+        undo.append(lambda: self._remove_user(user.id))
+
+    def replace_user(self, user: User, undo: List[Callable]) -> None:
+        previous = self.users.get(user.id)
+        if previous is None:
+            raise IntegrityError
+        if self.user_emails.get(user.email, user.id) != user.id:
+            raise IntegrityError
+        self._remove_user(user.id)
+        self._store_user(_copy(user))
+
+        def restore() -> None:
+            self._remove_user(user.id)
+            self._store_user(previous)
+
+        undo.append(restore)
+
+    def remove_user(self, user: User, undo: List[Callable]) -> None:
+        previous = self.users.get(user.id)
+        if previous is None:
+            return
+        if user.id in self.user_urls:
+            raise IntegrityError
+        self._remove_user(user.id)
+        undo.append(lambda: self._store_user(previous))
+
+    def _store_user(self, user: User) -> None:
+        self.users[user.id] = user
+        self.user_emails[user.email] = user.id
+
+    def _remove_user(self, id: UUID) -> None:
+        user = self.users.pop(id)
+        del self.user_emails[user.email]
+
+
+class InMemoryStorage(Storage):
+    """Storage over a :class:`MemoryDatabase`, with the same semantics as SQL.
+
+    Writes are queued and applied together by :meth:`commit`, which has no
+    await points and is therefore atomic with respect to other requests.
+    """
+
+    def __init__(self, db: MemoryDatabase) -> None:
+        self.db = db
+        self._writes: List[Tuple[Callable, object]] = []
+
+    async def commit(self) -> None:
+        writes, self._writes = self._writes, []
+        undo: List[Callable] = []
+        try:
+            for apply, obj in writes:
+                apply(obj, undo)
+        except Exception:
+            for revert in reversed(undo):
+                revert()
+            raise
+
+    async def rollback(self) -> None:
+        self._writes = []
+
+    def _staged_codes(self) -> set:
+        return {
+            obj.short_code
+            for apply, obj in self._writes
+            if apply == self.db.insert_url
+        }
+
+    async def get_redirect(
+        self, short_code: str
+    ) -> Optional[Tuple[UUID, str, Optional[datetime], bool, bool]]:
+        url = self.db.urls.get(self.db.url_codes.get(short_code))
+        if url is None:
+            return None
+        return (
+            url.id,
+            url.original_url,
+            url.expires_at,
+            url.is_permanent,
+            url.analytics_enabled,
+        )
+
+    async def get_url(self, short_code: str) -> Optional[ShortURL]:
+        url = self.db.urls.get(self.db.url_codes.get(short_code))
+        return None if url is None else _copy(url)
+
+    async def get_url_owner(
+        self, short_code: str
+    ) -> Optional[Tuple[UUID, Optional[UUID]]]:
+        url = self.db.urls.get(self.db.url_codes.get(short_code))
+        return None if url is None else (url.id, url.user_id)
+
+    def _user_url_ids(self, user_id: UUID, after: Optional[UUID]) -> List[UUID]:
+        ids = self.db.user_urls.get(user_id, [])
+        if after is not None:
+            ids = ids[: bisect_left(ids, after)]
+        return ids
+
+    async def list_urls(
+        self, user_id: UUID, limit: int, after: Optional[UUID] = None
+    ) -> Sequence:
+        ids = self._user_url_ids(user_id, after)
+        return [_copy(self.db.urls[id]) for id in reversed(ids[-limit:])]
+
+    async def stream_urls(
+        self, user_id: UUID, after: Optional[UUID] = None
+    ) -> AsyncIterator:
+        for id in reversed(list(self._user_url_ids(user_id, after))):
+            url = self.db.urls.get(id)
+            if url is not None:
+                yield _copy(url)
+
+    def _fill_url(self, url: ShortURL) -> None:
+        url.id = url.id or self.db.new_id()
+        url.created_at = url.created_at or datetime.now(timezone.utc)
+        url.visit_count = url.visit_count or 0
+
+    def add_url(self, url: ShortURL) -> None:
+        self._fill_url(url)
+        self._writes.append((self.db.insert_url, url))
+
+    async def add_urls(self, urls: List[ShortURL]) -> List[ShortURL]:
+        taken = self._staged_codes()
+        inserted = []
+        for url in urls:
+            if url.short_code in taken or url.short_code in self.db.url_codes:
+                continue
+            taken.add(url.short_code)
+            self.add_url(url)
+            inserted.append(url)
+        return inserted
+
+    def update_url(self, url: ShortURL) -> None:
+        self._writes.append((self.db.replace_url, url))
+
+    async def delete_url(self, url: ShortURL) -> None:
+        self._writes.append((self.db.remove_url, url))
+
+    async def get_visit_buckets(
+        self, short_url_id: UUID, granularity: str, start: datetime, end: datetime
+    ) -> List[Tuple[datetime, int]]:
+        return []
+
+    async def get_visitor_sketches(
+        self, short_url_id: UUID, start: datetime, end: datetime
+    ) -> List[bytes]:
+        return []
+
+    async def code_block_size(self) -> int:
+        return self.db.code_block_size
+
+    async def lease_code_blocks(self, count: int) -> List[int]:
+        size = self.db.code_block_size
+        start = self.db.next_code_id
+        self.db.next_code_id += count * size
+        return [start + i * size for i in range(count)]
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        user = self.db.users.get(self.db.user_emails.get(email.lower()))
+        return None if user is None else _copy(user)
+
+    async def get_user_by_id(self, id: str) -> Optional[User]:
+        user = self.db.users.get(_parse_id(id))
+        return None if user is None else _copy(user)
+
+    async def get_principal(self, id: str) -> Optional[Principal]:
+        user = self.db.users.get(_parse_id(id))
+        if user is None:
+            return None
+        return Principal(
+            user.id,
+            user.username,
+            user.email,
+            user.is_active,
+            user.is_superuser,
+            user.created_at,
+            user.updated_at,
+        )
+
+    def add_user(self, user: User) -> None:
+        now = datetime.now(timezone.utc)
+        user.id = user.id or self.db.new_id()
+        user.email = user.email.lower()
+        user.created_at = user.created_at or now
+        user.updated_at = user.updated_at or now
+        user.is_active = True if user.is_active is None else user.is_active
+        user.is_superuser = bool(user.is_superuser)
+        self._writes.append((self.db.insert_user, user))
+
+    def update_user(self, user: User) -> None:
+        user.email = user.email.lower()
+        user.updated_at = datetime.now(timezone.utc)
+        self._writes.append((self.db.replace_user, user))
+
+    async def delete_user(self, user: User) -> None:
+        self._writes.append((self.db.remove_user, user))
@@ -0,0 +1,310 @@
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from API.cache import Principal, publish_invalidation, register_invalidation_handler
+from API.db import (
+    CODE_SEQUENCE,
+    ReplicaRouter,
+    ShortURL,
+    User,
+    VisitDaily,
+    VisitHourly,
+    replica_router,
+)
+from API.exceptions import IntegrityError, ShortCodeTaken
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError as alchemy_IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .base import Storage
+
+# Rows per INSERT statement; 6 bind parameters per row stays below the 32767
+# parameter limit of the Postgres protocol.
+BULK_INSERT_CHUNK = 5000
+
+# Built once: the compiled form is reused from SQLAlchemy's statement cache
+# and asyncpg keeps it prepared on each pooled connection. Only columns of
+# ix_shorturl_redirect are read, so Postgres answers from the index.
+REDIRECT_QUERY = select(
+    ShortURL.id,
+    ShortURL.original_url,
+    ShortURL.expires_at,
+    ShortURL.is_permanent,
+    ShortURL.analytics_enabled,
+).where(ShortURL.short_code == bindparam("short_code"))
+
+
+def is_short_code_collision(exp: alchemy_IntegrityError) -> bool:
+    return "short_code" in str(exp.orig)
+
+
+class SQLStorage(Storage):
+    """Storage backed by Postgres.
+
+    Writes, and reads of rows that are about to be changed, use ``session``
+    on the primary. Read-only lookups use a second session on the engine
+    picked by ``router``, which is a replica unless the acting user wrote
+    something within the read-your-writes window.
+    """
+
+    def __init__(
+        self, session: AsyncSession, router: Optional[ReplicaRouter] = None
+    ) -> None:
+        self.session = session
+        self.router = router
+        self.user_id: Optional[str] = None
+        self._read_session: Optional[AsyncSession] = None
+        self._wrote = False
+        # Objects whose server-generated columns are re-read after commit.
+        self._refresh: list = []
+
+    def act_for(self, user_id: str) -> None:
+        self.user_id = user_id
+
+    def _new_read_session(self) -> AsyncSession:
+        engine = (
+            self.session.bind
+            if self.router is None
+            else self.router.read_engine(self.user_id)
+        )
+        return AsyncSession(engine, expire_on_commit=False)
+
+    def _reader(self) -> AsyncSession:
+        if self.router is None or not self.router.replicas or self._wrote:
+            return self.session
+        if self._read_session is None:
+            engine = self.router.read_engine(self.user_id)
+            self._read_session = (
+                self.session
+                if engine is self.router.primary
+                else AsyncSession(engine, expire_on_commit=False)
+            )
+        return self._read_session
+
+    async def close(self) -> None:
+        if self._read_session is not None and self._read_session is not self.session:
+            await self._read_session.close()
+        self._read_session = None
+
+    async def commit(self) -> None:
+        try:
+            await self.session.commit()
+        except alchemy_IntegrityError as exp:
+            await self.rollback()
+            if is_short_code_collision(exp):
+                raise ShortCodeTaken()
+            raise IntegrityError
+        pending, self._refresh = self._refresh, []
+        for obj in pending:
+            await self.session.refresh(obj)
+        if self._wrote and self.user_id and self.router and self.router.replicas:
+            # Every API process sends this user's reads to the primary for a
+            # while, until the replicas have replayed the write.
+            await publish_invalidation("write", [self.user_id])
+
+    async def rollback(self) -> None:
+        self._refresh = []
+        await self.session.rollback()
+
+    @staticmethod
+    def _list_urls_query(user_id: UUID, after: Optional[UUID]):
+        query = (
+            select(
+                ShortURL.id,
+                ShortURL.original_url,
+                ShortURL.short_code,
+                ShortURL.visit_count,
+                ShortURL.created_at,
+                ShortURL.expires_at,
+                ShortURL.is_permanent,
+                ShortURL.analytics_enabled,
+            )
+            .where(ShortURL.user_id == user_id)
+            .order_by(ShortURL.id.desc())
+        )
+        if after is not None:
+            query = query.where(ShortURL.id < after)
+        return query
+
+    async def get_redirect(
+        self, short_code: str
+    ) -> Optional[Tuple[UUID, str, Optional[datetime], bool, bool]]:
+        # Always the primary: the result fills the shared and local caches,
+        # and a lagging replica could refill them with a link that was just
+        # changed or deleted. The lookup is one covering index probe.
+        params = {"short_code": short_code}
+        return (await self.session.exec(REDIRECT_QUERY, params=params)).first()
+
+    async def get_url(self, short_code: str) -> Optional[ShortURL]:
+        url = await self.session.exec(
+            select(ShortURL).where(ShortURL.short_code == short_code)
+        )
+        return url.first()
+
+    async def get_url_owner(
+        self, short_code: str
+    ) -> Optional[Tuple[UUID, Optional[UUID]]]:
+        url = await self._reader().exec(
+            select(ShortURL.id, ShortURL.user_id).where(
+                ShortURL.short_code == short_code
+            )
+        )
+        return url.first()
+
+    async def list_urls(
+        self, user_id: UUID, limit: int, after: Optional[UUID] = None
+    ) -> Sequence:
+        urls = await self._reader().exec(
+            self._list_urls_query(user_id, after).limit(limit)
+        )
+        return urls.all()
+
+    async def stream_urls(
+        self, user_id: UUID, after: Optional[UUID] = None
+    ) -> AsyncIterator:
+        # Read through a server-side cursor on a session of its own, as the
+        # request's sessions may be closed before a streamed body is sent.
+        async with self._new_read_session() as session:
+            urls = await session.stream(
+                self._list_urls_query(user_id, after).execution_options(
+                    yield_per=1000
+                )
+            )
+            async for url in urls:
+                yield url
+
+    def add_url(self, url: ShortURL) -> None:
+        self._wrote = True
+        self.session.add(url)
+        self._refresh.append(url)
+
+    async def add_urls(self, urls: List[ShortURL]) -> List[ShortURL]:
+        self._wrote = True
+        table = ShortURL.__table__
+        by_code = {url.short_code: url for url in urls}
+        inserted = []
+        for start in range(0, len(urls), BULK_INSERT_CHUNK):
+            rows = [
+                {
+                    "short_code": url.short_code,
+                    "original_url": url.original_url,
+                    "user_id": url.user_id,
+                    "expires_at": url.expires_at,
+                    "is_permanent": url.is_permanent,
+                    "analytics_enabled": url.analytics_enabled,
+                }
+                for url in urls[start : start + BULK_INSERT_CHUNK]
+            ]
+            result = await self.session.exec(
+                insert(table)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=[table.c.short_code])
+                .returning(table.c.id, table.c.short_code, table.c.created_at)
+            )
+            for row in result:
+                url = by_code[row.short_code]
+                url.id = row.id
+                url.created_at = row.created_at
+                url.visit_count = 0
+                inserted.append(url)
+        return inserted
+
+    def update_url(self, url: ShortURL) -> None:
+        self._wrote = True
+        self.session.add(url)
+        self._refresh.append(url)
+
+    async def delete_url(self, url: ShortURL) -> None:
+        self._wrote = True
+        await self.session.delete(url)
+
+    async def get_visit_buckets(
+        self, short_url_id: UUID, granularity: str, start: datetime, end: datetime
+    ) -> List[Tuple[datetime, int]]:
+        rollup = VisitHourly if granularity == "hour" else VisitDaily
+        buckets = await self._reader().exec(
+            select(rollup.bucket, rollup.visits)
+            .where(
+                rollup.short_url_id == short_url_id,
+                rollup.bucket >= start,
+                rollup.bucket < end,
+            )
+            .order_by(rollup.bucket)
+        )
+        return list(buckets.all())
+
+    async def get_visitor_sketches(
+        self, short_url_id: UUID, start: datetime, end: datetime
+    ) -> List[bytes]:
+        first_day = start.astimezone(timezone.utc).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        sketches = await self._reader().exec(
+            select(VisitDaily.visitors).where(
+                VisitDaily.short_url_id == short_url_id,
+                VisitDaily.bucket >= first_day,
+                VisitDaily.bucket < end,
+                VisitDaily.visitors.is_not(None),
+            )
+        )
+        return list(sketches.all())
+
+    async def code_block_size(self) -> int:
+        # The sequence's stored increment, not the configured block size, so
+        # processes configured differently never lease overlapping ids.
+        return await self.session.scalar(
+            text("SELECT increment_by FROM pg_sequences WHERE sequencename = :name"),
+            {"name": CODE_SEQUENCE},
+        )
+
+    async def lease_code_blocks(self, count: int) -> List[int]:
+        starts = await self.session.scalars(
+            text(f"SELECT nextval('{CODE_SEQUENCE}') FROM generate_series(1, :count)"),
+            {"count": count},
+        )
+        return list(starts)
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        user = await self.session.exec(select(User).where(User.email == email.lower()))
+        return user.first()
+
+    async def get_user_by_id(self, id: str) -> Optional[User]:
+        user = await self.session.exec(select(User).where(User.id == id))
+        return user.first()
+
+    async def get_principal(self, id: str) -> Optional[Principal]:
+        user = await self._reader().exec(
+            select(
+                User.id,
+                User.username,
+                User.email,
+                User.is_active,
+                User.is_superuser,
+                User.created_at,
+                User.updated_at,
+            ).where(User.id == id)
+        )
+        user = user.first()
+        return None if user is None else Principal(*user)
+
+    def add_user(self, user: User) -> None:
+        user.email = user.email.lower()
+        self._wrote = True
+        self.session.add(user)
+        self._refresh.append(user)
+
+    def update_user(self, user: User) -> None:
+        user.email = user.email.lower()
+        self._wrote = True
+        self.session.add(user)
+        self._refresh.append(user)
+
+    async def delete_user(self, user: User) -> None:
+        self._wrote = True
+        await self.session.delete(user)
+
+
+register_invalidation_handler("write", replica_router.record_write)
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from API.config import settings
+from API.db import engine, replica_router
+from API.fastpath import prepared_redirect_statement
+from API.services import MainService
+from API.storage import get_storage
+from API.storage.sql import REDIRECT_QUERY
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.ext.asyncio.engine import AsyncEngine
+
+"""
+Startup warm-up. Until it has finished, /readyz answers 503 so the load
+balancer keeps traffic on warm replicas: the first requests after a deploy
+would otherwise each pay for a connection handshake, statement preparation
+and a cold redirect cache.
+"""
+
+logger = logging.getLogger(__name__)
+
+WARMING, READY, STOPPING = "warming", "ready", "stopping"
+
+
+class Warmup:
+    """Opens the connection pools, primes the redirect statement on every
+    connection and loads the hottest codes into the redirect cache.
+
+    A step that fails is logged and skipped, and the replica reports ready
+    after ``timeout`` seconds whatever is left: a replica serving cold is
+    better than one that never joins the rotation.
+    """
+
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        self.state = WARMING
+        self.connections = 0
+        self.prewarmed = 0
+        self.duration: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def stop(self) -> None:
+        """Report not ready while shutting down."""
+        self.state = STOPPING
+
+    async def run(self) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._warm(), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Warm-up did not finish within %.0fs", self.timeout)
+        except Exception:
+            logger.exception("Warm-up failed")
+        self.duration = time.perf_counter() - start
+        if self.state == WARMING:
+            self.state = READY
+        logger.info(
+            "Ready after %.2fs: %d connections primed, %d redirects cached",
+            self.duration,
+            self.connections,
+            self.prewarmed,
+        )
+
+    async def _warm(self) -> None:
+        if settings.STORAGE_BACKEND == "sql":
+            # Redirects only read the primary; replica pools are just opened.
+            await asyncio.gather(
+                self.open_pool(engine),
+                *(
+                    self.open_pool(replica.engine, prime=False)
+                    for replica in replica_router.replicas
+                ),
+            )
+        if settings.SHARED_CACHE_ENABLED and settings.HOT_CODES_PREWARM:
+            async with asynccontextmanager(get_storage)() as storage:
+                self.prewarmed = await MainService().prewarm(
+                    storage, settings.HOT_CODES_PREWARM
+                )
+
+    async def open_pool(self, target: AsyncEngine, prime: bool = True) -> None:
+        """Check out ``POOL_SIZE`` connections at once, so the pool opens that
+        many, prime each (if ``prime``) and check them back in."""
+        results = await asyncio.gather(
+            *(target.connect().start() for _ in range(settings.POOL_SIZE)),
+            return_exceptions=True,
+        )
+        connections = [conn for conn in results if isinstance(conn, AsyncConnection)]
+        if len(connections) < len(results):
+            logger.warning(
+                "Opened %d of %d connections to %s",
+                len(connections),
+                len(results),
+                target.url.host,
+            )
+        try:
+            if not prime:
+                self.connections += len(connections)
+                return
+            primed = await asyncio.gather(
+                *(self._prime(conn) for conn in connections), return_exceptions=True
+            )
+            self.connections += sum(result is None for result in primed)
+        finally:
+            await asyncio.gather(
+                *(conn.close() for conn in connections), return_exceptions=True
+            )
+
+    @staticmethod
+    async def _prime(conn: AsyncConnection) -> None:
+        # The routed redirect's statement (SQLAlchemy's compiled cache and the
+        # driver's statement cache) and the fast path's prepared statement.
+        await conn.execute(REDIRECT_QUERY, {"short_code": ""})
+        await prepared_redirect_statement(await conn.get_raw_connection())
+
+
+warmup = Warmup(timeout=settings.WARMUP_TIMEOUT)
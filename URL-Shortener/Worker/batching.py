@@ -0,0 +1,142 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional
+
+
+class UnwrittenRows(Exception):
+    """Raised by a batch write that failed after committing part of the batch.
+
+    ``rows`` are the rows not written yet; retrying only those keeps the
+    committed part from being written twice.
+    """
+
+    def __init__(self, rows: List[dict]) -> None:
+        super().__init__(f"{len(rows)} rows not written")
+        self.rows = rows
+
+
+class FlushStats:
+    """Running statistics about batch flushes."""
+
+    def __init__(self) -> None:
+        self.flushes = 0
+        self.rows = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_rows = 0
+        self.max_rows = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def record(self, rows: int, latency: float) -> None:
+        self.flushes += 1
+        self.rows += rows
+        self.last_rows = rows
+        self.max_rows = max(self.max_rows, rows)
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+
+    def snapshot(self) -> dict:
+        return {
+            "flushes": self.flushes,
+            "rows": self.rows,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "rows_per_flush": self.rows / self.flushes if self.flushes else 0.0,
+            "last_rows": self.last_rows,
+            "max_rows": self.max_rows,
+            "avg_latency_ms": (
+                1000 * self.total_latency / self.flushes if self.flushes else 0.0
+            ),
+            "last_latency_ms": 1000 * self.last_latency,
+            "max_latency_ms": 1000 * self.max_latency,
+        }
+
+
+class Batcher:
+    """Accumulates rows and hands them to ``write`` in batches.
+
+    A batch is flushed when ``max_rows`` rows are buffered or ``interval``
+    seconds after its first row arrived, whichever comes first. Must only be
+    used from the event loop it was created on.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[dict]], Awaitable[None]],
+        max_rows: int,
+        interval: float,
+        max_pending: Optional[int] = None,
+    ) -> None:
+        self.write = write
+        self.max_rows = max_rows
+        self.interval = interval
+        # Rows from failed flushes are retried as long as the buffer stays
+        # below this size; beyond it they are dropped. ``write`` has to set
+        # aside rows that can never be written itself (see write_visits), or
+        # one of them would fail every retry, and raise UnwrittenRows when it
+        # fails after committing some of them.
+        self.max_pending = max_pending or max_rows * 20
+        self.stats = FlushStats()
+        self._rows: List[dict] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set[asyncio.Task] = set()
+
+    def add(self, row: dict) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self.max_rows:
+            self._schedule_flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.interval, self._schedule_flush)
+
+    def extend(self, rows: List[dict]) -> None:
+        for row in rows:
+            self.add(row)
+
+    def _schedule_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        task = asyncio.get_running_loop().create_task(self._flush(rows))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, rows: List[dict]) -> None:
+        start = time.perf_counter()
+        try:
+            await self.write(rows)
+        except Exception as exc:
+            self.stats.failures += 1
+            if isinstance(exc, UnwrittenRows):
+                rows = exc.rows
+                exc = exc.__cause__ or exc
+            if len(self._rows) + len(rows) <= self.max_pending:
+                print(f"Visit flush of {len(rows)} rows failed, retrying: {exc!r}")
+                self._rows[:0] = rows
+                if self._timer is None:
+                    loop = asyncio.get_running_loop()
+                    self._timer = loop.call_later(self.interval, self._schedule_flush)
+            else:
+                print(f"Visit flush of {len(rows)} rows failed, dropping: {exc!r}")
+                self.stats.dropped += len(rows)
+            return
+        self.stats.record(len(rows), time.perf_counter() - start)
+
+    async def close(self) -> None:
+        """Flush everything still buffered and wait for in-flight writes."""
+        self._schedule_flush()
+        while self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._rows:
+            print(f"Dropping {len(self._rows)} unflushed visits on shutdown")
+            self.stats.dropped += len(self._rows)
+            self._rows = []
@@ -0,0 +1,311 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+from typing import List, Optional, Tuple
+
+from batching import UnwrittenRows
+import config
+import main as worker
+from metrics import serve
+from prometheus import Collected, Counter
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy import text
+
+"""
+Visit consumer for the API's VISIT_TRANSPORT=stream. Run next to (or instead
+of) the Celery worker:
+
+    python consumer.py
+
+Reads batches of visit events from a Dragonfly stream through a consumer
+group on a plain asyncio loop, keeps up to VISIT_CONSUMER_CONCURRENCY batch
+writes in flight and acknowledges each write's entries with one XACK. There
+are no task results: an entry is acknowledged once its visits are committed
+and entries left unacknowledged by a crash are claimed by another consumer,
+so delivery is at least once (a crash between commit and XACK writes a batch
+twice). Visits Postgres rejects are dropped row by row (see
+main.write_visits), and after a write that failed part way only the rows not
+committed are put back in the stream. An entry is only dropped whole once it
+has failed VISIT_STREAM_MAX_DELIVERIES times, the last time on its own.
+"""
+
+Entry = Tuple[str, Optional[dict]]
+
+STREAM_ENTRIES = worker.registry.register(
+    Counter(
+        "worker_stream_entries_total",
+        "Visit stream entries handled, by result",
+        labels=("result",),
+    )
+)
+
+
+class StreamConsumer:
+    """Consumes visit batches from ``stream`` as ``name`` in consumer ``group``.
+
+    Reading waits for a free write slot, so at most ``concurrency`` writes run
+    at once and unread entries stay in the stream rather than in memory.
+    """
+
+    def __init__(
+        self,
+        stream: str,
+        group: str,
+        name: str,
+        concurrency: int,
+        read_count: int,
+        block_ms: int,
+        claim_idle_ms: int,
+        max_deliveries: int,
+    ) -> None:
+        self.stream = stream
+        self.group = group
+        self.name = name
+        self.read_count = read_count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self._slots = asyncio.Semaphore(concurrency)
+        self._writes: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    async def ensure_group(self) -> None:
+        try:
+            await worker.redis_client.xgroup_create(
+                self.stream, self.group, id="0", mkstream=True
+            )
+        except ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    def in_flight(self) -> int:
+        return len(self._writes)
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def run(self) -> None:
+        """Consume until :meth:`stop`, then wait for the writes in flight."""
+        await self.ensure_group()
+        reclaimer = asyncio.create_task(self.reclaim())
+        # Entries this consumer read but never acknowledged before a restart
+        # come first ("0"), then new ones (">").
+        last_id = "0"
+        try:
+            while not self._stopping.is_set():
+                await self._slots.acquire()
+                try:
+                    response = await worker.redis_client.xreadgroup(
+                        self.group,
+                        self.name,
+                        {self.stream: last_id},
+                        count=self.read_count,
+                        block=self.block_ms if last_id == ">" else None,
+                    )
+                except RedisError as exc:
+                    self._slots.release()
+                    print(f"Reading {self.stream} failed: {exc!r}")
+                    await asyncio.sleep(1)
+                    continue
+                entries = response[0][1] if response else []
+                if last_id != ">":
+                    last_id = entries[-1][0] if entries else ">"
+                if entries:
+                    self._start_write(entries)
+                else:
+                    self._slots.release()
+        finally:
+            reclaimer.cancel()
+            while self._writes:
+                await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def _start_write(self, entries: List[Entry], last_attempt: bool = False) -> None:
+        task = asyncio.get_running_loop().create_task(
+            self._write(entries, last_attempt)
+        )
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, entries: List[Entry], last_attempt: bool = False) -> None:
+        try:
+            rows = []
+            # id(row) -> the entry and the event it came from.
+            sources = {}
+            events = {}
+            skipped = 0
+            for entry_id, fields in entries:
+                try:
+                    loads = json.loads(fields["events"])
+                    loaded = [worker.visit_row(load) for load in loads]
+                except (TypeError, KeyError, ValueError) as exc:
+                    # Malformed or trimmed; retrying cannot help.
+                    print(f"Skipping visit stream entry {entry_id}: {exc!r}")
+                    skipped += 1
+                    continue
+                rows.extend(loaded)
+                sources.update((id(row), entry_id) for row in loaded)
+                events.update((id(row), load) for row, load in zip(loaded, loads))
+            try:
+                # Rows Postgres rejects are set aside by write_visits; the rest
+                # of their entries is written and the entries are acknowledged.
+                rejected = await worker.write_visits(rows) if rows else []
+            except Exception as exc:
+                unwritten = exc.rows if isinstance(exc, UnwrittenRows) else rows
+                if len(unwritten) < len(rows):
+                    await self._requeue(entries, unwritten, sources, events, skipped)
+                    print(
+                        f"Writing {len(rows)} streamed visits failed part way, "
+                        f"requeued {len(unwritten)}: {exc.__cause__!r}"
+                    )
+                    return
+                if last_attempt and await self._database_up():
+                    # Failing on its own against a healthy database: give up.
+                    await self._ack(entries)
+                    STREAM_ENTRIES.inc(("dead",), len(entries))
+                    print(
+                        f"Dropped visit stream entry {entries[0][0]} after "
+                        f"{self.max_deliveries} delivery attempts: {exc!r}"
+                    )
+                    return
+                # Left pending; reclaim() hands the entries out again.
+                STREAM_ENTRIES.inc(("failed",), len(entries))
+                print(f"Writing {len(rows)} streamed visits failed: {exc!r}")
+                return
+            await self._ack(entries)
+            partial = len({sources[id(row)] for row in rejected})
+            STREAM_ENTRIES.inc(("acked",), len(entries) - skipped - partial)
+            if partial:
+                STREAM_ENTRIES.inc(("rejected",), partial)
+            if skipped:
+                STREAM_ENTRIES.inc(("malformed",), skipped)
+        except RedisError as exc:
+            print(f"Acknowledging {len(entries)} visit stream entries failed: {exc!r}")
+        finally:
+            self._slots.release()
+
+    async def _requeue(
+        self,
+        entries: List[Entry],
+        unwritten: List[dict],
+        sources: dict,
+        events: dict,
+        skipped: int,
+    ) -> None:
+        """Put the ``unwritten`` rows of a partly committed write back in the
+        stream as a new entry and acknowledge ``entries``; redelivering them
+        would write the committed part twice."""
+        await worker.redis_client.xadd(
+            self.stream, {"events": json.dumps([events[id(row)] for row in unwritten])}
+        )
+        await self._ack(entries)
+        requeued = len({sources[id(row)] for row in unwritten})
+        STREAM_ENTRIES.inc(("requeued",), requeued)
+        STREAM_ENTRIES.inc(("acked",), len(entries) - skipped - requeued)
+        if skipped:
+            STREAM_ENTRIES.inc(("malformed",), skipped)
+
+    async def _ack(self, entries: List[Entry]) -> None:
+        await worker.redis_client.xack(
+            self.stream, self.group, *(entry_id for entry_id, _ in entries)
+        )
+
+    @staticmethod
+    async def _database_up() -> bool:
+        try:
+            async with worker.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        except Exception:
+            return False
+        return True
+
+    async def reclaim(self) -> None:
+        """Take over entries other consumers (or failed writes) left pending."""
+        while True:
+            await asyncio.sleep(self.claim_idle_ms / 2000)
+            try:
+                pending = await worker.redis_client.xpending_range(
+                    self.stream,
+                    self.group,
+                    min="-",
+                    max="+",
+                    count=self.read_count * 25,
+                    idle=self.claim_idle_ms,
+                )
+                last = [
+                    item["message_id"]
+                    for item in pending
+                    if item["times_delivered"] >= self.max_deliveries
+                ]
+                if last:
+                    # One entry per write, so an entry is only dropped when it
+                    # fails by itself while the database is reachable; an
+                    # outage leaves everything pending.
+                    claimed = await worker.redis_client.xclaim(
+                        self.stream, self.group, self.name, self.claim_idle_ms, last
+                    )
+                    for entry in claimed:
+                        await self._slots.acquire()
+                        self._start_write([entry], last_attempt=True)
+                retry = [
+                    item["message_id"]
+                    for item in pending
+                    if item["times_delivered"] < self.max_deliveries
+                ]
+                for start in range(0, len(retry), self.read_count):
+                    claimed = await worker.redis_client.xclaim(
+                        self.stream,
+                        self.group,
+                        self.name,
+                        self.claim_idle_ms,
+                        retry[start : start + self.read_count],
+                    )
+                    if claimed:
+                        await self._slots.acquire()
+                        self._start_write(claimed)
+            except RedisError as exc:
+                print(f"Reclaiming visit stream entries failed: {exc!r}")
+
+
+async def main() -> None:
+    worker.connect()
+    consumer = StreamConsumer(
+        stream=config.VISIT_STREAM,
+        group=config.VISIT_STREAM_GROUP,
+        name=f"{socket.gethostname()}-{os.getpid()}",
+        concurrency=config.VISIT_CONSUMER_CONCURRENCY,
+        read_count=config.VISIT_STREAM_READ_COUNT,
+        block_ms=config.VISIT_STREAM_BLOCK_MS,
+        claim_idle_ms=config.VISIT_STREAM_CLAIM_IDLE_MS,
+        max_deliveries=config.VISIT_STREAM_MAX_DELIVERIES,
+    )
+    worker.registry.register(
+        Collected(
+            "worker_stream_writes_in_flight",
+            "Visit batch writes currently running",
+            lambda: {(): consumer.in_flight()},
+        )
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, consumer.stop)
+    metrics_server = None
+    if config.WORKER_METRICS_PORT:
+        try:
+            metrics_server = await serve(worker.registry, config.WORKER_METRICS_PORT)
+        except OSError as exc:
+            print(f"Consumer metrics disabled: {exc!r}")
+    print(f"Consuming {config.VISIT_STREAM} as {consumer.name}...")
+    try:
+        await consumer.run()
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        await worker.engine.dispose()
+        await worker.redis_client.aclose()
+        print("Visit consumer stopped.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,193 @@
+import logging
+import random
+import re
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+"""
+Query timing for an async SQLAlchemy engine: per-statement-fingerprint latency
+histograms and row counts, connection pool checkout wait times and a sampled
+slow query log.
+
+The worker runs an identical copy; see check_copies.py.
+"""
+
+logger = logging.getLogger("sql.slow")
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERAL = re.compile(r"\$\d+|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_CAST = re.compile(r"\?::\w+(?:\s+\w+)*?(?=\s*[,)])")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROW_LIST = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+
+
+def fingerprint(statement: str) -> str:
+    """Normalize a statement so executions differing only in values share a key."""
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _LITERAL.sub("?", statement)
+    statement = _CAST.sub("?", statement)
+    statement = _PLACEHOLDER_LIST.sub("(?)", statement)
+    return _ROW_LIST.sub("(?), ...", statement)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        # One counter per bucket plus the +Inf bucket; not cumulative.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> dict:
+        return {
+            "buckets": dict(zip([*self.buckets, float("inf")], self.counts)),
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+        }
+
+
+class StatementStats:
+    def __init__(self) -> None:
+        self.latency = Histogram()
+        self.rows = 0
+        self.errors = 0
+
+    def snapshot(self) -> dict:
+        return {**self.latency.snapshot(), "rows": self.rows, "errors": self.errors}
+
+
+class QueryStats:
+    """Collects timings from the execute events of the engines it is attached to."""
+
+    def __init__(
+        self,
+        slow_threshold: float = 0.2,
+        slow_sample_rate: float = 1.0,
+        max_fingerprints: int = 500,
+    ) -> None:
+        self.slow_threshold = slow_threshold
+        self.slow_sample_rate = slow_sample_rate
+        self.max_fingerprints = max_fingerprints
+        self.statements: Dict[str, StatementStats] = {}
+        self.pool_wait = Histogram()
+        self.slow_queries = 0
+        self._fingerprints: Dict[str, str] = {}
+
+    def attach(self, engine: AsyncEngine) -> None:
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_execute)
+        event.listen(sync_engine, "handle_error", self._on_error)
+        if isinstance(sync_engine.pool, InstrumentedQueuePool):
+            sync_engine.pool.query_stats = self
+
+    def _fingerprint(self, statement: str) -> str:
+        key = self._fingerprints.get(statement)
+        if key is None:
+            if len(self._fingerprints) >= 4 * self.max_fingerprints:
+                self._fingerprints.clear()
+            key = self._fingerprints[statement] = fingerprint(statement)
+        return key
+
+    def _stats_for(self, statement: str) -> StatementStats:
+        key = self._fingerprint(statement)
+        stats = self.statements.get(key)
+        if stats is None:
+            if len(self.statements) >= self.max_fingerprints:
+                key = "<other>"
+                stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats()
+        return stats
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        rows = cursor.rowcount
+        if rows is None or rows < 0:
+            # The asyncpg adapter only reports rowcount for DML; SELECT results
+            # are already buffered on the cursor.
+            rows = len(getattr(cursor, "_rows", ()) or ())
+        self.record(statement, elapsed, rows)
+
+    def record(self, statement: str, elapsed: float, rows: int) -> None:
+        """Account one execution, also for statements run on a raw driver connection."""
+        stats = self._stats_for(statement)
+        stats.latency.observe(elapsed)
+        stats.rows += rows
+        if elapsed >= self.slow_threshold:
+            self.slow_queries += 1
+            if random.random() < self.slow_sample_rate:
+                logger.warning(
+                    "Slow query (%.1f ms, %d rows): %s",
+                    elapsed * 1000,
+                    rows,
+                    self._fingerprint(statement),
+                )
+
+    def _on_error(self, context) -> None:
+        starts = context.connection.info.get("query_start") if context.connection else None
+        if starts:
+            starts.pop()
+        if context.statement:
+            self._stats_for(context.statement).errors += 1
+
+    def record_pool_wait(self, elapsed: float) -> None:
+        self.pool_wait.observe(elapsed)
+
+    def snapshot(self) -> dict:
+        return {
+            "statements": {
+                key: stats.snapshot() for key, stats in self.statements.items()
+            },
+            "pool_wait": self.pool_wait.snapshot(),
+            "slow_queries": self.slow_queries,
+        }
+
+    def top(self, n: int = 10, by: str = "sum") -> List[tuple]:
+        """The ``n`` fingerprints with the highest total (or max/count) latency."""
+        return sorted(
+            ((key, getattr(stats.latency, by)) for key, stats in self.statements.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )[:n]
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool reporting how long each checkout waited for a connection."""
+
+    query_stats: Optional[QueryStats] = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.query_stats is not None:
+                self.query_stats.record_pool_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.query_stats = self.query_stats
+        return pool
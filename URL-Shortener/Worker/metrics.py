@@ -0,0 +1,34 @@
+import asyncio
+
+from prometheus import Registry
+
+"""
+Serving the worker's metrics (see prometheus.py). Every prefork child keeps
+its own registry and serves it on WORKER_METRICS_PORT plus its process index,
+since children share no memory.
+"""
+
+
+async def _handle_scrape(registry: Registry, reader, writer) -> None:
+    try:
+        # Any request gets the metrics; read and discard the request head.
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        body = registry.render().encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4\r\n"
+            + f"Content-Length: {len(body)}\r\n".encode()
+            + b"Connection: close\r\n\r\n"
+            + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(registry: Registry, port: int, host: str = "0.0.0.0"):
+    """Serve ``registry`` over plain HTTP on the running event loop."""
+    return await asyncio.start_server(
+        lambda reader, writer: _handle_scrape(registry, reader, writer), host, port
+    )
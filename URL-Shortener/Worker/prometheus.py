@@ -0,0 +1,170 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+"""
+Minimal Prometheus-style metric primitives and text exposition. Updating a
+metric is a dict lookup and an increment, so it can sit on hot paths; values
+that already live elsewhere are read by callbacks at scrape time instead of
+being mirrored on every update.
+
+The worker runs an identical copy; see check_copies.py.
+"""
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _histogram_lines(
+    name: str,
+    label_names: Sequence[str],
+    labels: Labels,
+    buckets: Sequence[float],
+    counts: Sequence[int],
+    total: float,
+) -> List[str]:
+    """Render non-cumulative bucket ``counts`` (the last one is +Inf)."""
+    lines = []
+    cumulative = 0
+    for bound, count in zip([*buckets, "+Inf"], counts):
+        cumulative += count
+        le = _format_labels(label_names, labels, f'le="{bound}"')
+        lines.append(f"{name}_bucket{le} {cumulative}")
+    plain = _format_labels(label_names, labels)
+    lines.append(f"{name}_count{plain} {cumulative}")
+    lines.append(f"{name}_sum{plain} {total}")
+    return lines
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Per label set: one counter per bucket, the +Inf bucket, then the sum.
+        self.values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, series in self.values.items():
+            lines.extend(
+                _histogram_lines(
+                    self.name, self.label_names, labels, self.buckets,
+                    series[:-1], series[-1],
+                )
+            )
+        return lines
+
+
+class Collected:
+    """Gauge or counter whose samples are produced by ``collect`` at scrape time."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], Dict[Labels, float]],
+        labels: Sequence[str] = (),
+        kind: str = "gauge",
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+            for labels, value in self.collect().items()
+        ]
+
+
+class CollectedHistogram:
+    """Histogram rendered from objects exposing ``buckets``, ``counts`` and ``sum``."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], Dict[Labels, object]],
+        labels: Sequence[str] = (),
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, histogram in self.collect().items():
+            lines.extend(
+                _histogram_lines(
+                    self.name, self.label_names, labels, histogram.buckets,
+                    histogram.counts, histogram.sum,
+                )
+            )
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: list = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
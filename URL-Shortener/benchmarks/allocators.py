@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of the short code allocators.
+
+Run from the URL-Shortener directory:
+
+    python -m benchmarks.allocators --count 200000
+
+The sequence allocator's lease round trip is replaced by a local counter, so
+the numbers show the per-code CPU cost only. "ordered" is the share of codes
+that sort after the previously generated one, a proxy for how close inserts
+into the short_code B-tree come to pure appends.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("POSTGRES_URL_ASYNC", "postgresql+asyncpg://localhost/benchmark")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+
+from API.config import settings  # noqa: E402
+from API.services.codes import (  # noqa: E402
+    FeistelScrambler,
+    NanoidAllocator,
+    SequenceAllocator,
+)
+
+
+class LocalSequenceAllocator(SequenceAllocator):
+    """SequenceAllocator leasing from an in-process counter instead of Postgres."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._block_size_checked = True
+        self._sequence = 1
+
+    async def _lease_blocks(self, count, storage):
+        starts = [self._sequence + i * self.block_size for i in range(count)]
+        self._sequence += count * self.block_size
+        return starts
+
+
+async def measure(allocator, count: int, batch: int) -> dict:
+    codes = []
+    start = time.perf_counter()
+    if batch == 1:
+        for _ in range(count):
+            codes.append(await allocator.allocate(None))
+    else:
+        for _ in range(0, count, batch):
+            codes.extend(await allocator.allocate_many(batch, None))
+    elapsed = time.perf_counter() - start
+    ordered = sum(1 for a, b in zip(codes, codes[1:]) if b > a)
+    return {
+        "codes": len(codes),
+        "ns_per_code": 1e9 * elapsed / len(codes),
+        "codes_per_sec": len(codes) / elapsed,
+        "unique": len(set(codes)) == len(codes),
+        "ordered": ordered / max(1, len(codes) - 1),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--length", type=int, default=settings.SHORT_CODE_LENGTH)
+    parser.add_argument("--block-size", type=int, default=settings.SHORT_CODE_BLOCK_SIZE)
+    parser.add_argument("--batch", type=int, default=1, help="codes per allocate call")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    alphabet = settings.NANO_CODE_STRING
+    domain = len(alphabet) ** args.length
+    allocators = {
+        "nanoid": NanoidAllocator(alphabet, args.length),
+        "sequence": LocalSequenceAllocator(alphabet, args.length, args.block_size),
+        "sequence+scramble": LocalSequenceAllocator(
+            alphabet,
+            args.length,
+            args.block_size,
+            scrambler=FeistelScrambler(domain, settings.SECRET_KEY.encode()),
+        ),
+    }
+    results = {}
+    for name, allocator in allocators.items():
+        results[name] = await measure(allocator, args.count, args.batch)
+        r = results[name]
+        print(
+            f"{name:<18} {r['ns_per_code']:>9.0f} ns/code "
+            f"{r['codes_per_sec']:>12,.0f} codes/s  ordered={r['ordered']:.2f} "
+            f"unique={r['unique']}"
+        )
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump({"args": vars(args), "results": results}, fp, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""
+Checks that the modules the worker copies from the API have not drifted.
+
+The API and the worker are built from separate Docker contexts (./API and
+./Worker), so the worker cannot import API code and carries copies of it.
+Run from the URL-Shortener directory, e.g. before committing or in CI:
+
+    python check_copies.py
+
+Exits with status 1 and names the copies that differ from their original.
+"""
+
+import ast
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+# (original, copy): files that must be byte for byte identical.
+COPIED_FILES = [
+    ("API/hll.py", "Worker/hll.py"),
+    ("API/db/partitions.py", "Worker/partitions.py"),
+    ("API/db/instrumentation.py", "Worker/instrumentation.py"),
+    ("API/prometheus.py", "Worker/prometheus.py"),
+]
+
+# Table models the worker defines in its main module. They are compared as
+# syntax trees, so only comments and formatting may differ.
+COPIED_MODELS = ("API/db/models.py", "Worker/main.py")
+MODELS = ["ShortURL", "Visit", "VisitHourly", "VisitDaily", "VisitCountFold"]
+
+
+def classes(path: Path) -> dict:
+    tree = ast.parse(path.read_text(), filename=str(path))
+    return {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+
+
+def check() -> list:
+    """Descriptions of the copies that differ; empty if all match."""
+    problems = []
+    for original, copy in COPIED_FILES:
+        if (ROOT / original).read_bytes() != (ROOT / copy).read_bytes():
+            problems.append(f"{copy} differs from {original}")
+    original, copy = COPIED_MODELS
+    expected, actual = classes(ROOT / original), classes(ROOT / copy)
+    for name in MODELS:
+        if name not in actual:
+            problems.append(f"{copy} lacks model {name} from {original}")
+        elif ast.dump(expected[name]) != ast.dump(actual[name]):
+            problems.append(f"Model {name} in {copy} differs from {original}")
+    return problems
+
+
+if __name__ == "__main__":
+    problems = check()
+    for problem in problems:
+        print(problem)
+    sys.exit(1 if problems else 0)